@@ -9,6 +9,14 @@
 #------------------------------------------------------------------------------
 
 import csv
+from collections import namedtuple
+
+from open_sld.jtag import JTAG_STATES
+from open_sld.sld_interface import load_numpy
+
+# NumPy, loaded by decode() for vectorized decoding. None until then,
+# False if it isn't installed.
+np = None
 
 #------------------------------------------------------------------------------
 #
@@ -95,6 +103,65 @@ class DataContainer(object):
         # Getter property method for self.now
         return float(self.step) - 0.5
 
+#------------------------------------------------------------------------------
+#
+# A generator of binary trace data, see open_sld/ft245_trace.py
+#
+# The trace is memory-mapped and its rows have the attributes of a
+# DataContainer.
+
+def trace(file_name):
+
+    from open_sld.ft245_trace import TraceReader
+
+    with TraceReader(file_name) as reader:
+        step = reader.first_step
+        for value in bytearray(reader.pins()):
+            yield TraceRow(value, step)
+            step += 1
+
+#----
+#
+# Pin values as '0'/'1' strings, D0 first, for each byte value
+
+pin_table = [tuple('1' if (b >> i) & 1 else '0' for i in range(8))
+             for b in range(256)]
+
+#------------------------------------------------------------------------------
+#
+# A row of trace data
+
+class TraceRow(object):
+
+    __slots__ = ('value', 'step_number')
+
+    def __init__(self, value, step_number):
+        self.value       = value
+        self.step_number = step_number
+
+    #----
+
+    @property
+    def step(self):
+        return str(self.step_number)
+
+    @property
+    def byte_count(self):
+        return self.value & 0x3F
+
+    @property
+    def bits(self):
+        return list(pin_table[self.value])
+
+    @property
+    def now(self):
+        return self.step_number - 0.5
+
+# D0-D7 attributes
+for i, name in enumerate(signal_names[1:9]):
+    setattr(TraceRow, name, property(lambda self, i=i: pin_table[self.value][i]))
+del i, name
+
 #------------------------------------------------------------------------------
 #
 # CPLD Logic
@@ -103,11 +170,14 @@ class DataContainer(object):
 
 class CPLD(object):
     
-    def __init__(self, byte_stream, mode):
+    def __init__(self, byte_stream, mode, stop_time=600.5):
        
         self.byte_stream = byte_stream
         self.mode        = mode
         
+        # Decoding ends after this step, None decodes everything
+        self.stop_time   = stop_time
+        
     #----
         
     def run(self):
@@ -170,13 +240,142 @@ class CPLD(object):
                         
       
                 t = new_byte.now
-                if t > 600.5:
+                if self.stop_time is not None and t > self.stop_time:
                     break
                 
         except StopIteration:
             print
             print 'Done'
 
+#------------------------------------------------------------------------------
+#
+# Vectorized CPLD Logic
+#
+# The same decoding as CPLD, on NumPy arrays of pin bytes and their times.
+# TCK edges and byte-shift regions are found with array operations, and
+# run() yields an EdgeBatch for each run of bit-mode rows and each byte
+# shift, with a column per event field.
+
+EdgeBatch = namedtuple('EdgeBatch', 'direction tms tdi rd now')
+
+# Bits D0-D7 of each byte
+bit_shifts = None
+
+def load_vector_support():
+    global np, bit_shifts
+    if np is None:
+        np = load_numpy()
+        if np:
+            bit_shifts = np.arange(8, dtype=np.uint8)
+    return np
+
+class VectorCPLD(object):
+
+    def __init__(self, values, now, mode, stop_time=600.5):
+
+        self.values    = values
+        self.now       = now
+        self.mode      = mode
+        self.stop_time = stop_time
+
+    #----
+
+    def run(self):
+
+        v, now = self.values, self.now
+        n      = len(v)
+        tck    = v & 1
+
+        # Candidate byte-shift headers, data bytes can have D7 set too
+        headers = np.flatnonzero(v & 0x80)
+
+        # The first row is only compared with
+        i = 1
+        if self.mode == CPLD_START:
+            # Wait for tck == 0, that row isn't decoded
+            zeros = np.flatnonzero(tck[1:] == 0)
+            if not len(zeros):
+                print
+                print 'Done'
+                return
+            i = int(zeros[0]) + 1
+            self.mode = CPLD_BIT
+            print 'EXIT START at ', float(now[i])
+            i += 1
+
+        while True:
+
+            # Bit mode up to the next header
+            k = np.searchsorted(headers, i)
+            h = int(headers[k]) if k < len(headers) else n
+            end = max(h, i)
+
+            # Decoding ends on the first bit mode row after stop_time
+            stopped = False
+            if self.stop_time is not None and i < end:
+                late = np.flatnonzero(now[i:end] > self.stop_time)
+                if len(late):
+                    end = i + int(late[0]) + 1
+                    stopped = True
+
+            if i < end:
+                batch = self.bit_edges(i, end)
+                if len(batch.direction):
+                    yield batch
+            if stopped:
+                return
+            if h >= n:
+                print
+                print 'Done'
+                return
+
+            # Byte mode
+            byte_count = int(v[h]) & 0x3F
+            byte_read  = bool(v[h] & 0x40)
+            if byte_read:
+                print 'byte shift read mode %d' % byte_count
+            else:
+                print 'byte shift mode %d' % byte_count
+
+            if byte_count and h + 1 < n:
+                yield self.byte_edges(h + 1, min(h + 1 + byte_count, n),
+                                      byte_read)
+
+            # The row after the data is read to leave byte mode
+            i = h + byte_count + 2
+            if i > n:
+                print
+                print 'Done'
+                return
+
+    #----
+    #
+    # TCK edges of rows a to b-1, each compared with the row before it
+
+    def bit_edges(self, a, b):
+
+        v   = self.values
+        tck = v & 1
+        changed = np.flatnonzero(tck[a:b] != tck[a - 1:b - 1]) + a
+        rows = v[changed]
+        return EdgeBatch(rows & 1, (rows >> 1) & 1, (rows >> 4) & 1,
+                         (rows >> 6) & 1, self.now[changed])
+
+    #----
+    #
+    # Eight bits of each row from a to b-1, D0 first, a rising and falling
+    # edge each, with TMS low
+
+    def byte_edges(self, a, b, byte_read):
+
+        m    = b - a
+        bits = (self.values[a:b, None] >> bit_shifts) & 1
+        return EdgeBatch(np.tile(np.array([RISING, FALLING], dtype=np.uint8), 8 * m),
+                         np.zeros(16 * m, dtype=np.uint8),
+                         np.repeat(bits.ravel(), 2),
+                         np.repeat(np.uint8(byte_read), 16 * m),
+                         np.repeat(self.now[a:b], 16))
+
 #------------------------------------------------------------------------------
 #
 # SLD controller
@@ -188,27 +387,10 @@ class SLD_Controller(object):
     def __init__(self, node_count, start='reset'):
  
         # A dict describing JTAG state transitions
+        self.jtag_states = JTAG_STATES
     
-        self.jtag_states = {
-            'capture_dr': ['shift_dr', 'exit1_dr'],
-             'capture_ir': ['shift_ir', 'exit1_ir'],
-             'exit1_dr': ['pause_dr', 'update_dr'],
-             'exit1_ir': ['pause_ir', 'update_ir'],
-             'exit2_dr': ['shift_dr', 'update_dr'],
-             'exit2_ir': ['shift_ir', 'update_ir'],
-             'idle': ['idle', 'select_dr'],
-             'pause_dr': ['pause_dr', 'exit2_dr'],
-             'pause_ir': ['pause_ir', 'exit2_ir'],
-             'reset': ['idle', 'reset'],
-             'select_dr': ['capture_dr', 'select_ir'],
-             'select_ir': ['capture_ir', 'reset'],
-             'shift_dr': ['shift_dr', 'exit1_dr'],
-             'shift_ir': ['shift_ir', 'exit1_ir'],
-             'update_dr': ['idle', 'select_dr'],
-             'update_ir': ['idle', 'select_dr']
-        }
-    
-        self.state    = start        
+        self.state     = start        
+        self.new_state = start
         self.ir_shift = ''
         self.dr_shift = ''
         
@@ -216,6 +398,11 @@ class SLD_Controller(object):
         self.dr = ''
         
         self.node_count = node_count
+
+        # States that TMS at this level keeps the TAP in
+        self.stay_tms = dict((state, tms)
+                             for state, next_states in self.jtag_states.items()
+                             for tms in (0, 1) if next_states[tms] == state)
         
     #----
         
@@ -260,23 +447,106 @@ class SLD_Controller(object):
                 else:
                     print
 
+    #----
+    #
+    # Run an EdgeBatch. Runs of edges that keep the TAP in a state that
+    # loops on itself are skipped in one step, shifting their TDI bits, and
+    # the rest go through TCK_rise and TCK_fall.
+
+    def run_batch(self, batch):
+
+        direction, tms, tdi, rd, now = batch
+        rising = direction == RISING
+        leave  = {0: np.flatnonzero(rising & (tms == 1)),
+                  1: np.flatnonzero(rising & (tms == 0))}
+
+        i = 0
+        n = len(direction)
+        while i < n:
+
+            # Up to the first rising edge that leaves the state
+            stay_tms = self.stay_tms.get(self.state)
+            j = i
+            if direction[i] == RISING and stay_tms is not None:
+                k = np.searchsorted(leave[stay_tms], i)
+                j = int(leave[stay_tms][k]) if k < len(leave[stay_tms]) else n
+
+            if j > i:
+                if self.state in ('shift_dr', 'shift_ir'):
+                    shifted = tdi[i:j][rising[i:j]][::-1] + ord('0')
+                    shifted = shifted.astype(np.uint8).tostring()
+                    if self.state == 'shift_dr':
+                        self.dr_shift = shifted + self.dr_shift
+                    else:
+                        self.ir_shift = shifted + self.ir_shift
+
+                self.new_state = self.state
+                i = j
+                continue
+
+            event = (direction[i], str(tms[i]), str(tdi[i]), rd[i], float(now[i]))
+            if direction[i] == RISING:
+                self.TCK_rise(event)
+            else:
+                self.TCK_fall(event)
+            i += 1
+
                     
 #------------------------------------------------------------------------------
 #
-# Main
+# Run a captured file through the CPLD and SLD controller
+#
+# Binary traces are recognised by their header, anything else is read as CSV.
+# With NumPy, and unless vectorized is False, VectorCPLD and batches are
+# used, which give the same log much faster. Without it rows are decoded
+# one at a time.
+
+def decode(file_name, mode=CPLD_BIT, stop_time=600.5, node_count=1,
+           vectorized=True):
 
-# This .csv file is broken!!
-#pld = CPLD(cvs('ft_245_data.csv'), CPLD_START)
+    with open(file_name, 'rb') as f:
+        is_trace = f.read(8) == 'FT245TRC'
 
-pld = CPLD(cvs('test2.csv'), CPLD_BIT)
+    sld = SLD_Controller(node_count)
 
-sld = SLD_Controller(1)
+    if vectorized and load_vector_support():
+        if is_trace:
+            from open_sld.ft245_trace import TraceReader
+            with TraceReader(file_name) as reader:
+                values = reader.array()
+                now = np.arange(len(values)) + (reader.first_step - 0.5)
+                for batch in VectorCPLD(values, now, mode, stop_time).run():
+                    sld.run_batch(batch)
+                del values
+        else:
+            from open_sld.ft245_trace import csv_rows
+            rows  = list(csv_rows(file_name))
+            steps = np.array([step for step, value in rows], dtype=np.float64)
+            values = np.array([value for step, value in rows], dtype=np.uint8)
+            for batch in VectorCPLD(values, steps - 0.5, mode, stop_time).run():
+                sld.run_batch(batch)
+        return sld
+
+    rows = trace(file_name) if is_trace else cvs(file_name)
+    pld = CPLD(rows, mode, stop_time)
+
+    for event in pld.run():
+        direction, tms, tdi, rd, t = event
+        
+        if direction == RISING:
+            sld.TCK_rise(event)
+        else:
+            sld.TCK_fall(event)
     
-for event in pld.run():
-    direction, tms, tdi, rd, t = event
+    return sld
+
+#------------------------------------------------------------------------------
+#
+# Main
+
+if __name__ == '__main__':
+
+    # This .csv file is broken!!
+    #decode('ft_245_data.csv', CPLD_START)
     
-    if direction == RISING:
-        sld.TCK_rise(event)
-    else:
-        sld.TCK_fall(event)
-                
+    decode('test2.csv')
@@ -0,0 +1,88 @@
+#------------------------------------------------------------------------------
+#
+#   bench_ftdi.py
+#
+#   Per-call overhead of the ctypes bindings in ftdi.py, compared with the
+#   original decorator wrappers
+#
+#   python bench_ftdi.py               - wrapper overhead only, using libc
+#   python bench_ftdi.py USB-Blaster   - FT_GetQueueStatus on the device
+#
+#------------------------------------------------------------------------------
+
+import sys
+import ctypes as c
+import ctypes.util
+import timeit
+
+from open_sld import ftdi
+from open_sld.ftdi import ftExceptionDecorator, _ft_status, _FT_FUNCTYPE, IN
+
+CALLS = 100000
+
+#------------------------------------------------------------------------------
+
+def report(name, seconds):
+    print '  %-36s %8.3f us/call' % (name, 1e6 * seconds / CALLS)
+
+#------------------------------------------------------------------------------
+#
+# Both styles wrapped around labs(0), which returns 0 (FT_OK) like a
+# successful d2xx call
+
+def bench_libc():
+
+    if sys.platform == 'win32':
+        libc = c.cdll.msvcrt
+        functype = c.CFUNCTYPE
+    else:
+        libc = c.CDLL(ctypes.util.find_library('c'))
+        functype = _FT_FUNCTYPE
+
+    @ftExceptionDecorator
+    def old_labs(*args):
+        return libc.labs(*args)
+
+    prototype = functype(c.c_ulong, c.c_long)
+    new_labs = prototype(('labs', libc), ((IN,),))
+    new_labs.errcheck = _ft_status
+
+    print 'wrapper overhead (libc labs):'
+    report('raw foreign call', timeit.timeit(lambda: libc.labs(0), number=CALLS))
+    report('ftExceptionDecorator wrapper',
+           timeit.timeit(lambda: old_labs(c.c_long(0)), number=CALLS))
+    report('bound prototype + errcheck',
+           timeit.timeit(lambda: new_labs(0), number=CALLS))
+
+#------------------------------------------------------------------------------
+#
+# get_queue_status() as it was, and as it is now
+
+def bench_device(name):
+
+    device = ftdi.open_ex_by_name(name)
+
+    @ftExceptionDecorator
+    def old_get_queue_status(*args):
+        return ftdi.ft.FT_GetQueueStatus(*args)
+
+    def old_style():
+        lpdwAmountInRxQueue = c.c_ulong()
+        old_get_queue_status(device.ftHandle, c.byref(lpdwAmountInRxQueue))
+        return lpdwAmountInRxQueue.value
+
+    print 'FT_GetQueueStatus on %s:' % name
+    report('ftExceptionDecorator wrapper', timeit.timeit(old_style, number=CALLS))
+    report('FTD2XX.get_queue_status()',
+           timeit.timeit(device.get_queue_status, number=CALLS))
+
+    device.close()
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        bench_device(sys.argv[1])
+    else:
+        bench_libc()
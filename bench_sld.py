@@ -0,0 +1,245 @@
+#------------------------------------------------------------------------------
+#
+#   bench_sld.py
+#
+#   Throughput of the SLD hot paths for DR widths from 7 bits to 64 kbit:
+#
+#     encode   - dataBuffer() and byteBuffer() command byte generation
+#     decode   - rx_bits() and rx_byte_bits() TDO decoding
+#     scan     - complete VDR_Write_Read() cycles on a device, with BitArray
+#                and BitVector data, and as a ScanTemplate
+#     trace    - 245_decode processing of CSV and binary trace captures,
+#                row by row and vectorized
+#
+#   Results are written as JSON, so runs of different versions can be
+#   compared.
+#
+#   python bench_sld.py                           - simulated USB-Blaster
+#   python bench_sld.py -d USB-Blaster -m 4 -n 1  - hardware
+#   python bench_sld.py -o results.json -b encode decode
+#
+#------------------------------------------------------------------------------
+
+import argparse
+import imp
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+from time import time, strftime
+
+from bitstring import BitArray
+
+from open_sld import sld_interface
+from open_sld.bits import BitVector
+from open_sld.sld_interface import (SLD_Controller, dataBuffer, byteBuffer,
+                                    rx_bits, rx_byte_bits, read_count)
+
+WIDTHS = [7, 64, 1024, 8192, 65536]
+
+BENCHMARKS = ['encode', 'decode', 'scan', 'trace']
+
+# Each measurement repeats until it has run this long
+MIN_TIME = 0.2
+
+#------------------------------------------------------------------------------
+#
+# Seconds per call of fn, the best of repeat runs of enough calls to take
+# min_time
+
+def measure(fn, min_time=MIN_TIME, repeat=3):
+
+    calls = 1
+    while True:
+        start = time()
+        for i in xrange(calls):
+            fn()
+        elapsed = time() - start
+        if elapsed >= min_time:
+            break
+        calls *= 2
+
+    best = elapsed
+    for i in range(repeat - 1):
+        start = time()
+        for i in xrange(calls):
+            fn()
+        best = min(best, time() - start)
+
+    return best / calls, calls
+
+#----
+
+def result(benchmark, variant, width, seconds, calls):
+    return {'benchmark': benchmark,
+            'variant': variant,
+            'width': width,
+            'seconds': seconds,
+            'calls': calls,
+            'bits_per_second': width / seconds}
+
+#----
+
+def pattern(width):
+    # Alternating ones and zeros
+    return BitArray(uint=int('01' * ((width + 1) // 2), 2) >> (width % 2),
+                    length=width)
+
+#------------------------------------------------------------------------------
+#
+# Command byte generation
+
+def bench_encode(widths, **args):
+
+    results = []
+    for width in widths:
+        bits = pattern(width)
+        for name, fn, rd in [('dataBuffer', dataBuffer, False),
+                             ('dataBuffer read', dataBuffer, True),
+                             ('byteBuffer', byteBuffer, False),
+                             ('byteBuffer read', byteBuffer, True)]:
+            seconds, calls = measure(lambda: fn(bits, rd))
+            results.append(result('encode', name, width, seconds, calls))
+    return results
+
+#------------------------------------------------------------------------------
+#
+# TDO decoding, of data as the FT245 would return it
+
+def bench_decode(widths, **args):
+
+    results = []
+    for width in widths:
+        bit_data = str(bytearray(i & 1 for i in range(width)))
+        byte_data = str(bytearray(i & 0xFF
+                                  for i in range(read_count(width, True))))
+
+        seconds, calls = measure(lambda: rx_bits(bit_data, width))
+        results.append(result('decode', 'rx_bits', width, seconds, calls))
+
+        seconds, calls = measure(lambda: rx_byte_bits(byte_data, width))
+        results.append(result('decode', 'rx_byte_bits', width, seconds, calls))
+    return results
+
+#------------------------------------------------------------------------------
+#
+# VDR_Write_Read cycles through node's DR, in byte and bit mode. The
+# simulator runs the TAP in Python, so it measures the host side cost,
+# not the USB link.
+
+def bench_scan(widths, device='SIM', m_width=4, n_width=1, node=1,
+               instruction=1, **args):
+
+    results = []
+    for byte_mode in (True, False):
+        sld = SLD_Controller(device, m_width, n_width, byte_mode=byte_mode)
+        sld.VIR_Write(node, BitArray(uint=instruction, length=m_width))
+
+        for width in widths:
+            mode = 'byte mode' if byte_mode else 'bit mode'
+            for bits in (pattern(width), BitVector.from_bitarray(pattern(width))):
+                seconds, calls = measure(lambda: sld.VDR_Write_Read(bits))
+                variant = '%s %s %s' % (device, mode, type(bits).__name__)
+                results.append(result('scan', variant, width, seconds, calls))
+
+            template = sld.template()
+            template.VIR_Write(node, BitArray(uint=instruction, length=m_width))
+            template.VDR_Write_Read(template.field(width))
+            # New data every run, so the field is always re-encoded
+            data = itertools.cycle([pattern(width).uint, 0]).next
+            seconds, calls = measure(lambda: template.run(data()))
+            variant = '%s %s ScanTemplate' % (device, mode)
+            results.append(result('scan', variant, width, seconds, calls))
+
+        sld.close()
+    return results
+
+#------------------------------------------------------------------------------
+#
+# 245_decode on a capture of one VDR_Write_Read of each width, as CSV and
+# as a binary trace
+
+def bench_trace(widths, **args):
+
+    decoder = imp.load_source('decode_245', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '245_decode.py'))
+
+    results = []
+    for width in widths:
+        for interface_name, suffix in (('CSV', '.csv'), ('TRACE', '.trc')):
+            fd, file_name = tempfile.mkstemp(suffix=suffix)
+            os.close(fd)
+
+            # CSV_Writer and 245_decode both print as they go
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                sld = SLD_Controller(interface_name, 4, 1, file_name)
+                sld.VIR_Write(1, BitArray('0b0001'))
+                sld.VDR_Write_Read(pattern(width))
+                sld.close()
+
+                timings = []
+                for vectorized in (False, True):
+                    timings.append(measure(
+                        lambda: decoder.decode(file_name, stop_time=None,
+                                               vectorized=vectorized)))
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+                os.remove(file_name)
+
+            for name, (seconds, calls) in zip(('rows', 'vectorized'), timings):
+                results.append(result('trace', '245_decode %s %s' % (
+                    interface_name, name), width, seconds, calls))
+    return results
+
+#------------------------------------------------------------------------------
+
+def run(benchmarks, widths, **args):
+
+    functions = {'encode': bench_encode,
+                 'decode': bench_decode,
+                 'scan': bench_scan,
+                 'trace': bench_trace}
+
+    results = []
+    for name in benchmarks:
+        print >>sys.stderr, 'running %s' % name
+        results += functions[name](widths, **args)
+
+    return {'date': strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': bool(sld_interface.load_numpy()),
+            'device': args.get('device', 'SIM'),
+            'results': results}
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='SLD throughput benchmarks')
+    parser.add_argument('-b', '--benchmarks', nargs='+', choices=BENCHMARKS,
+                        default=BENCHMARKS)
+    parser.add_argument('-w', '--widths', nargs='+', type=int, default=WIDTHS)
+    parser.add_argument('-d', '--device', default='SIM',
+                        help="'SIM' or the USB-Blaster's description")
+    parser.add_argument('-m', '--m-width', type=int, default=4)
+    parser.add_argument('-n', '--n-width', type=int, default=1)
+    parser.add_argument('--node', type=int, default=1)
+    parser.add_argument('--instruction', type=int, default=1)
+    parser.add_argument('-o', '--output', help='JSON file, default stdout')
+    a = parser.parse_args()
+
+    report = run(a.benchmarks, a.widths, device=a.device, m_width=a.m_width,
+                 n_width=a.n_width, node=a.node, instruction=a.instruction)
+
+    if a.output:
+        with open(a.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print
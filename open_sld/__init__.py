@@ -0,0 +1,79 @@
+#------------------------------------------------------------------------------
+#
+#   open_sld
+#
+#   Python access to the nodes of an Altera SLD hub through a USB-Blaster
+#
+#   Importing the package loads nothing else. The names below are imported
+#   from their modules on first use, so the d2xx library, bitstring and
+#   NumPy are only loaded by code that needs them.
+#
+#   python -m open_sld   - program the DE0-Nano and run the LED test
+#
+#------------------------------------------------------------------------------
+
+import sys
+import types
+import importlib
+
+__version__ = '0.0.1'
+
+_exports = {
+    'SLD_Controller':     'sld_interface',
+    'SLDTimeoutError':    'sld_interface',
+    'ScanSession':        'sld_interface',
+    'ScanResult':         'sld_interface',
+    'CSV_Writer':         'sld_interface',
+    'ScanTemplate':       'sld_template',
+    'BitVector':          'bits',
+    'FTDeviceError':      'ftdi',
+    'HubInfo':            'sld_hub',
+    'NodeInfo':           'sld_hub',
+    'TopologyCache':      'sld_hub',
+    'TransferProfile':    'sld_tuning',
+    'calibrate':          'sld_tuning',
+    'SLDStats':           'sld_stats',
+    'VDRCapture':         'sld_capture',
+    'Bitstream':          'sld_config',
+    'ConfigurationError': 'sld_config',
+    'FingerprintCache':   'sld_config',
+    'TraceWriter':        'ft245_trace',
+    'TraceReader':        'ft245_trace',
+    'SimulatedBlaster':   'sld_sim',
+    'DevicePool':         'sld_pool',
+    'AsyncSLDController': 'sld_async',
+    'SLDQueueFullError':  'sld_async',
+    'SLDClosedError':     'sld_async',
+    'SLDServer':          'sld_server',
+    'SLDClient':          'sld_server',
+}
+
+# Need asyncio, or trollius under Python 2, so not imported by
+# "from open_sld import *"
+_optional = ('AsyncSLDController', 'SLDQueueFullError', 'SLDClosedError',
+             'SLDServer', 'SLDClient')
+
+__all__ = sorted(name for name in _exports if name not in _optional)
+
+#------------------------------------------------------------------------------
+#
+# The package module is replaced by one that imports exported names on
+# first access. The original module is kept, Python 2 clears the globals
+# of a module when it is freed.
+
+class _Package(types.ModuleType):
+
+    def __getattr__(self, name):
+        module_name = _exports.get(name)
+        if module_name is None:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+        value = getattr(importlib.import_module('.' + module_name, __name__), name)
+        setattr(self, name, value)
+        return value
+
+_package = _Package(__name__, __doc__)
+_package.__dict__.update((k, v) for k, v in globals().items()
+                         if k in ('__file__', '__path__', '__package__',
+                                  '__version__', '__all__'))
+_package._original = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,75 @@
+#------------------------------------------------------------------------------
+#
+#   open_sld/__main__.py
+#
+#   Programs the DE0-Nano with InitialTest.sof and counts on its LEDs,
+#   printing each value read back
+#
+#   python -m open_sld          - USB-Blaster
+#   python -m open_sld SIM      - simulated USB-Blaster
+#   python -m open_sld CSV      - write commands to test2.csv, no programming
+#
+#------------------------------------------------------------------------------
+
+import sys
+from time import sleep, time
+
+from bitstring import BitArray
+
+from .sld_interface import SLD_Controller
+
+#------------------------------------------------------------------------------
+
+def main(interface_name='USB-Blaster'):
+
+    # For debug, 'CSV' writes the commands to test2.csv
+    sld = SLD_Controller(interface_name, 4, 1, 'test2.csv')
+
+    if interface_name != 'CSV':
+
+        # Program the DE0-Nano
+
+        print 'Programming ...'
+        start = time()
+        if sld.configure('InitialTest.sof'):
+            print 'configured in %.2f s' % (time() - start)
+        else:
+            print 'already configured'
+
+        print
+
+    print 'Testing'
+
+    sld.TAP_Reset()
+
+    # Write the LEDs and read back their last value, compiled once
+    leds = sld.template()
+    leds.VIR_Write(1, BitArray('0b0001'))
+    leds.VDR_Write_Read(leds.field(7))
+    leds.VIR_Write(1, BitArray('0b0000'))
+
+    d = 0
+    while True:
+
+        read_back, = leds.run(d)
+
+        print read_back.bin
+
+        if d == 127:
+            d = 0
+            break
+        else:
+            d += 1
+
+        if interface_name == 'USB-Blaster':
+            sleep(0.1)
+
+    sld.TAP_Reset()
+    sld.close()
+    print
+    print 'closed'
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,164 @@
+#------------------------------------------------------------------------------
+#
+#   bits.py
+#
+#   A compact bit vector for the scan pipeline
+#
+#   BitVector holds an int and a length. It has the parts of the BitArray
+#   interface the SLD code uses (uint, bin, bytes, len, +, indexing) and
+#   converts to and from BitArray, int and bytes. As with BitArray, index 0
+#   is the MSB, and the LSB is the first bit shifted.
+#
+#------------------------------------------------------------------------------
+
+from binascii import hexlify, unhexlify
+
+#------------------------------------------------------------------------------
+
+class BitVector(object):
+
+    __slots__ = ('uint', 'length')
+
+    def __init__(self, uint=0, length=0):
+        if uint < 0 or uint >> length:
+            raise ValueError('%d does not fit in %d bits' % (uint, length))
+        self.uint   = uint
+        self.length = length
+
+    #----
+    #
+    # Conversions
+
+    @classmethod
+    def from_bitarray(cls, bits):
+        return cls(bits.uint if len(bits) else 0, len(bits))
+
+    def to_bitarray(self):
+        from bitstring import BitArray
+        if not self.length:
+            return BitArray()
+        return BitArray(uint=self.uint, length=self.length)
+
+    #----
+    #
+    # Big-endian, like BitArray(bytes=...). With length, the first length
+    # bits of data are used.
+
+    @classmethod
+    def from_bytes(cls, data, length=None):
+        n = 8 * len(data)
+        if length is None:
+            length = n
+        elif length > n:
+            raise ValueError('%d bytes hold fewer than %d bits' % (len(data), length))
+        if not n:
+            return cls(0, 0)
+        return cls(int(hexlify(data), 16) >> (n - length), length)
+
+    @property
+    def bytes(self):
+        if self.length % 8:
+            raise ValueError('%d bits is not a whole number of bytes' % self.length)
+        if not self.length:
+            return ''
+        return unhexlify('%0*x' % (self.length // 4, self.uint))
+
+    #----
+
+    @property
+    def bin(self):
+        if not self.length:
+            return ''
+        return format(self.uint, '0%db' % self.length)
+
+    #----
+
+    def __len__(self):
+        return self.length
+
+    def __int__(self):
+        return self.uint
+
+    __long__ = __int__
+
+    #----
+    #
+    # Concatenation, self in the MSBs
+
+    def __add__(self, other):
+        n = len(other)
+        return BitVector((self.uint << n) | (other.uint if n else 0),
+                         self.length + n)
+
+    #----
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError('bit index out of range')
+        return bool((self.uint >> (self.length - 1 - i)) & 1)
+
+    def __iter__(self):
+        for i in range(self.length - 1, -1, -1):
+            yield bool((self.uint >> i) & 1)
+
+    #----
+    #
+    # Equal to a BitVector or BitArray with the same length and value
+
+    def __eq__(self, other):
+        try:
+            n = len(other)
+            return n == self.length and (not n or other.uint == self.uint)
+        except (TypeError, AttributeError):
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((self.uint, self.length))
+
+    #----
+
+    def __repr__(self):
+        return 'BitVector(0x%x, %d)' % (self.uint, self.length)
+
+#------------------------------------------------------------------------------
+#
+# API arguments
+#
+# BitArray and BitVector arguments are used as they are. An int needs a
+# size, bytes (str or bytearray) are size bits long, default all of them.
+
+def to_bits(data, size=None):
+
+    if isinstance(data, (int, long)):
+        if size is None:
+            raise ValueError('an int needs a size')
+        return BitVector(data, size)
+
+    if isinstance(data, (str, bytearray)):
+        return BitVector.from_bytes(data, size)
+
+    if size is not None and size != len(data):
+        raise ValueError('size is %d, data is %d bits' % (size, len(data)))
+    return data
+
+#----
+#
+# Length in bits of an argument to_bits() accepts, None for an int without
+# a size
+
+def bit_length(data, size=None):
+    if size is not None:
+        return size
+    if isinstance(data, (int, long)):
+        return None
+    if isinstance(data, (str, bytearray)):
+        return 8 * len(data)
+    return len(data)
@@ -0,0 +1,252 @@
+#------------------------------------------------------------------------------
+#
+#   ft245_trace.py
+#
+#   Binary traces of FT245 bus data
+#
+#   A trace is a 16 byte header followed by one byte per step, the state of
+#   the FT245 data pins D0-D7 (bit 0 is D0, TCK):
+#
+#       magic       8 bytes  'FT245TRC'
+#       version     uint16   1
+#       header size uint16   16, the data starts here
+#       first step  uint32   step number of the first byte
+#
+#   All little-endian. TraceWriter records what an SLD_Controller sends,
+#   TraceReader memory-maps a trace, and csv_to_trace() converts the CSV
+#   layout of CSV_Writer and the logic analyzer captures.
+#
+#   python -m open_sld.ft245_trace capture.csv capture.trc
+#
+#------------------------------------------------------------------------------
+
+import csv
+import mmap
+import struct
+
+from .sld_interface import RD, sHM, load_numpy
+
+#------------------------------------------------------------------------------
+
+TRACE_MAGIC   = 'FT245TRC'
+TRACE_VERSION = 1
+TRACE_HEADER  = struct.Struct('<8sHHI')
+
+#----
+
+def write_header(f, first_step=1):
+    f.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, TRACE_HEADER.size,
+                              first_step))
+
+#----
+#
+# True if the file starts with the trace magic
+
+def is_trace(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+#------------------------------------------------------------------------------
+#
+# Writer
+#
+# An SLD_Controller interface, like CSV_Writer. SLD_Controller('TRACE', ...)
+# writes to csv_file_name. Reads return zeros, and get_queue_status()
+# returns the number of read bytes the commands written so far would have
+# produced.
+
+class TraceWriter(object):
+
+    def __init__(self, file_name):
+
+        self.f  = open(file_name, 'wb')
+        self.fn = file_name
+        write_header(self.f)
+
+        # Read bytes owed, and the byte-shift state across writes
+        self.pending    = 0
+        self.shift_left = 0
+        self.shift_read = False
+
+    #----
+
+    def reset_device(self):
+        pass
+
+    #----
+
+    def write(self, buff):
+        return self.write_from(buff)
+
+    #----
+
+    def write_from(self, data, offset=0, size=None):
+
+        view = buffer(data, offset) if size is None else buffer(data, offset, size)
+        self.f.write(view)
+        self.count_reads(bytearray(view))
+        return len(view)
+
+    #----
+
+    def count_reads(self, data):
+
+        i = 0
+        n = len(data)
+        while i < n:
+            if self.shift_left:
+                step = min(self.shift_left, n - i)
+                if self.shift_read:
+                    self.pending += step
+                self.shift_left -= step
+                i += step
+                continue
+
+            b = data[i]
+            if b & sHM:
+                self.shift_left = b & 0x3F
+                self.shift_read = bool(b & RD)
+            elif b & RD:
+                self.pending += 1
+            i += 1
+
+    #----
+
+    def get_queue_status(self):
+        return self.pending
+
+    #----
+
+    def read(self, count, raw=True):
+        count = min(count, self.pending)
+        self.pending -= count
+        return '\x00' * count
+
+    def read_into(self, buff, offset=0, size=None):
+        if size is None:
+            size = len(buff) - offset
+        data = self.read(size)
+        buff[offset:offset + len(data)] = data
+        return len(data)
+
+    #----
+
+    def close(self):
+        self.f.close()
+
+#------------------------------------------------------------------------------
+#
+# Reader
+#
+# The pin bytes are memory-mapped: reader[i] is the byte of step
+# first_step + i, pins() a buffer of all of them and array() a NumPy view.
+
+class TraceReader(object):
+
+    def __init__(self, file_name):
+
+        self.f = open(file_name, 'rb')
+        self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < TRACE_HEADER.size:
+            raise ValueError('%s is not an FT245 trace' % file_name)
+        magic, version, header_size, first_step = \
+            TRACE_HEADER.unpack_from(self.map)
+        if magic != TRACE_MAGIC:
+            raise ValueError('%s is not an FT245 trace' % file_name)
+        if version > TRACE_VERSION:
+            raise ValueError('%s is trace version %d' % (file_name, version))
+
+        self.header_size = header_size
+        self.first_step  = first_step
+
+    #----
+
+    def __len__(self):
+        return len(self.map) - self.header_size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('step index out of range')
+        return ord(self.map[self.header_size + i])
+
+    #----
+
+    def pins(self):
+        return buffer(self.map, self.header_size)
+
+    def array(self):
+        np = load_numpy()
+        return np.frombuffer(self.map, dtype=np.uint8, offset=self.header_size)
+
+    #----
+
+    def close(self):
+        self.map.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+#------------------------------------------------------------------------------
+#
+# Conversion
+#
+# CSV rows are a step number then D0, D1 ... one column per pin. Logic
+# analyzer captures have more columns after D7, which aren't kept, and
+# CSV_Writer drops the top bits of small values.
+#
+# A generator of (step, pin byte) for each row
+
+def csv_rows(csv_name):
+
+    with open(csv_name, 'rb') as src:
+        for row in csv.reader(src, delimiter=',', quotechar='|'):
+            if not row:
+                continue
+            value = 0
+            for i, pin in enumerate(row[1:9]):
+                if pin.strip() == '1':
+                    value |= 1 << i
+            yield int(row[0]), value
+
+#----
+#
+# Steps are assumed to be consecutive. Returns the number of steps.
+
+def csv_to_trace(csv_name, trace_name):
+
+    with open(trace_name, 'wb') as dst:
+        steps = 0
+        chunk = bytearray()
+        for step, value in csv_rows(csv_name):
+            if not steps:
+                write_header(dst, step)
+            chunk.append(value)
+            steps += 1
+            if len(chunk) >= 65536:
+                dst.write(chunk)
+                chunk = bytearray()
+        if not steps:
+            write_header(dst)
+        dst.write(chunk)
+
+    return steps
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import sys
+
+    if len(sys.argv) != 3:
+        print 'usage: python -m open_sld.ft245_trace capture.csv capture.trc'
+        sys.exit(1)
+
+    print '%d steps' % csv_to_trace(sys.argv[1], sys.argv[2])
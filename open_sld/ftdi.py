@@ -27,6 +27,10 @@ FT_OPEN_BY_SERIAL_NUMBER = 1
 FT_OPEN_BY_DESCRIPTION = 2
 FT_PURGE_RX = 1
 FT_PURGE_TX = 2
+FT_EVENT_RXCHAR = 1
+FT_EVENT_MODEM_STATUS = 2
+
+WAIT_OBJECT_0 = 0
 
 class FtdiBitModes:
     RESET         = 0x0
@@ -57,11 +61,25 @@ ft_messages = ['OK',
                 'OTHER_ERROR']
 
 #------------------------------------------------------------------------------
+#
+# The d2xx library is loaded by the first call to one of its functions,
+# so this module can be imported where the driver isn't installed.
 
-if sys.platform == 'win32':
-    ft = c.windll.ftd2xx
-else:
-    ft = c.CDLL('libftd2xx.so')
+ft = None
+
+def load_library():
+    '''load the d2xx library and bind its functions, returns the library'''
+    global ft
+    if ft is None:
+        if sys.platform == 'win32':
+            ft = c.windll.ftd2xx
+        else:
+            ft = c.CDLL('libftd2xx.so')
+
+        g = globals()
+        for attr, name, params in _ft_bindings:
+            g[attr] = _ft_bind(name, *params)
+    return ft
 
 #------------------------------------------------------------------------------
 #
@@ -103,99 +121,119 @@ def ftExceptionDecorator(f):
 
 #------------------------------------------------------------------------------
 #
-# DTFI Functions with exception wrappers
-
-@ftExceptionDecorator
-def _PY_GetDeviceInfo(*args):
-    return ft.FT_GetDeviceInfo(*args)
-
-@ftExceptionDecorator
-def _PY_OpenEx(*args):
-    return ft.FT_OpenEx(*args)
-
-@ftExceptionDecorator
-def _PY_Open(*args):
-    return ft.FT_Open(*args)
-
-@ftExceptionDecorator
-def _PY_ListDevices(*args):
-    return ft.FT_ListDevices(*args)
-
-@ftExceptionDecorator
-def _PY_Close(*args):
-    return ft.FT_Close(*args)
-
-@ftExceptionDecorator
-def _PY_Read(*args):
-    return ft.FT_Read(*args)
-
-@ftExceptionDecorator
-def _PY_Write(*args):
-    return ft.FT_Write(*args)
-
-@ftExceptionDecorator
-def _PY_SetBaudRate(*args):
-    return ft.FT_SetBaudRate(*args)
-
-@ftExceptionDecorator
-def _PY_ResetDevice(*args):
-    return ft.FT_ResetDevice(*args)
-
-@ftExceptionDecorator
-def _PY_Purge(*args):
-    return ft.FT_Purge(*args)
-
-@ftExceptionDecorator
-def _PY_SetTimeouts(*args):
-    return ft.FT_SetTimeouts(*args)
-
-@ftExceptionDecorator
-def _PY_SetBitMode(*args): # added by CJBH
-    return ft.FT_SetBitMode(*args)
-
-@ftExceptionDecorator
-def _PY_GetQueueStatus(*args):
-    return ft.FT_GetQueueStatus(*args)
-
-@ftExceptionDecorator
-def _PY_GetStatus(*args):
-    return ft.FT_GetStatus(*args)
-
-@ftExceptionDecorator
-def _PY_SetLatencyTimer(*args):
-    return ft.FT_SetLatencyTimer(*args)
-
-@ftExceptionDecorator
-def _PY_SetUSBParameters(*args):
-    return ft.FT_SetUSBParameters(*args)
-
-@ftExceptionDecorator
-def _PY_ResetPort(*args):
-    return ft.FT_ResetPort(*args)
-
-@ftExceptionDecorator
-def _PY_CyclePort(*args):
-    return ft.FT_CyclePort(*args)
+# DTFI Functions
+#
+# Each d2xx function is resolved once, and ctypes checks its FT_STATUS
+# result through errcheck, raising FTDeviceError. Until the library is
+# loaded each _PY_ name is a placeholder that loads it; load_library()
+# then replaces them all with the foreign functions, so afterwards there
+# is no Python wrapper between the caller and the foreign function.
+#
+# Functions bound with parameter types have them declared, so ctypes
+# doesn't inspect the arguments on each call. OUT parameters are created
+# by ctypes and their values returned, e.g. _PY_GetQueueStatus(ftHandle)
+# returns the number of bytes in the RX queue. Functions bound without
+# parameter types take ctypes arguments, as before.
 
-@ftExceptionDecorator
-def _PY_CreateDeviceInfoList(*args):
-    return ft.FT_CreateDeviceInfoList(*args)
+# A pointer, 64 bits on 64-bit Windows
+FT_HANDLE = c.c_void_p
+FT_STATUS = c.c_ulong
+LPDWORD   = c.POINTER(c.c_ulong)
 
-@ftExceptionDecorator
-def _PY_GetDeviceInfoList(*args):
-    return ft.FT_GetDeviceInfoList(*args)
+IN  = 1
+OUT = 2
 
-@ftExceptionDecorator
-def _PY_GetDeviceInfoDetail(*args):
-    return ft.FT_GetDeviceInfoDetail(*args)
+FT_NOT_SUPPORTED = 17
 
-@ftExceptionDecorator
-def _PY_GetDriverVersion(*args):
-    return ft.FT_GetDriverVersion(*args)
+if sys.platform == 'win32':
+    _FT_FUNCTYPE = c.WINFUNCTYPE
+else:
+    _FT_FUNCTYPE = c.CFUNCTYPE
+
+def _ft_status(status, func, args):
+    if status != FT_OK:
+        raise FTDeviceError(status)
+    return None
+
+def _ft_outputs(status, func, args):
+    if status != FT_OK:
+        raise FTDeviceError(status)
+    return args
+
+def _ft_not_supported(*args):
+    raise FTDeviceError(FT_NOT_SUPPORTED)
+
+def _ft_bind(name, *params):
+    '''bind d2xx function name. params are (IN|OUT, ctype) pairs'''
+    try:
+        if not params:
+            fn = ft[name]
+            fn.restype = FT_STATUS
+            fn.errcheck = _ft_status
+            return fn
+
+        prototype = _FT_FUNCTYPE(FT_STATUS, *[t for d, t in params])
+        fn = prototype((name, ft), tuple((d,) for d, t in params))
+    except AttributeError:
+        # Not in this platform's library
+        return _ft_not_supported
+
+    if OUT in [d for d, t in params]:
+        fn.errcheck = _ft_outputs
+    else:
+        fn.errcheck = _ft_status
+    return fn
 
-@ftExceptionDecorator
-def _PY_GetLibraryVersion(*args):
-    return ft.FT_GetLibraryVersion(*args)
+#----
+#
+# Record a binding for load_library(), returning the placeholder. FT_Name
+# is bound to _PY_Name.
+
+_ft_bindings = []
+
+def _ft_lazy(name, *params):
+    attr = '_PY_' + name[3:]
+    _ft_bindings.append((attr, name, params))
+    def first_call(*args):
+        load_library()
+        return globals()[attr](*args)
+    return first_call
+
+#----
+
+_PY_Close           = _ft_lazy('FT_Close', (IN, FT_HANDLE))
+_PY_Read            = _ft_lazy('FT_Read', (IN, FT_HANDLE), (IN, c.c_void_p),
+                                (IN, c.c_ulong), (OUT, LPDWORD))
+_PY_Write           = _ft_lazy('FT_Write', (IN, FT_HANDLE), (IN, c.c_void_p),
+                                (IN, c.c_ulong), (OUT, LPDWORD))
+_PY_SetBaudRate     = _ft_lazy('FT_SetBaudRate', (IN, FT_HANDLE), (IN, c.c_ulong))
+_PY_ResetDevice     = _ft_lazy('FT_ResetDevice', (IN, FT_HANDLE))
+_PY_Purge           = _ft_lazy('FT_Purge', (IN, FT_HANDLE), (IN, c.c_ulong))
+_PY_SetTimeouts     = _ft_lazy('FT_SetTimeouts', (IN, FT_HANDLE),
+                                (IN, c.c_ulong), (IN, c.c_ulong))
+_PY_SetBitMode      = _ft_lazy('FT_SetBitMode', (IN, FT_HANDLE),
+                                (IN, c.c_ubyte), (IN, c.c_ubyte))
+_PY_GetQueueStatus  = _ft_lazy('FT_GetQueueStatus', (IN, FT_HANDLE),
+                                (OUT, LPDWORD))
+_PY_GetStatus       = _ft_lazy('FT_GetStatus', (IN, FT_HANDLE), (OUT, LPDWORD),
+                                (OUT, LPDWORD), (OUT, LPDWORD))
+_PY_SetLatencyTimer = _ft_lazy('FT_SetLatencyTimer', (IN, FT_HANDLE),
+                                (IN, c.c_ubyte))
+_PY_SetUSBParameters = _ft_lazy('FT_SetUSBParameters', (IN, FT_HANDLE),
+                                 (IN, c.c_ulong), (IN, c.c_ulong))
+_PY_ResetPort       = _ft_lazy('FT_ResetPort', (IN, FT_HANDLE))
+_PY_CyclePort       = _ft_lazy('FT_CyclePort', (IN, FT_HANDLE))
+_PY_CreateDeviceInfoList = _ft_lazy('FT_CreateDeviceInfoList', (OUT, LPDWORD))
+
+_PY_GetDeviceInfo        = _ft_lazy('FT_GetDeviceInfo')
+_PY_OpenEx               = _ft_lazy('FT_OpenEx')
+_PY_Open                 = _ft_lazy('FT_Open')
+_PY_ListDevices          = _ft_lazy('FT_ListDevices')
+_PY_GetDeviceInfoList    = _ft_lazy('FT_GetDeviceInfoList')
+_PY_GetDeviceInfoDetail  = _ft_lazy('FT_GetDeviceInfoDetail')
+_PY_SetEventNotification = _ft_lazy('FT_SetEventNotification')
+_PY_GetDriverVersion     = _ft_lazy('FT_GetDriverVersion')
+_PY_GetLibraryVersion    = _ft_lazy('FT_GetLibraryVersion')
 
 
 #------------------------------------------------------------------------------
@@ -221,9 +259,7 @@ def list_devices():
 
 def create_device_info_list():
     """Create the internal device info list and return number of entries"""
-    lpdwNumDevs = c.c_ulong()
-    _PY_CreateDeviceInfoList(c.byref(lpdwNumDevs))
-    return lpdwNumDevs.value
+    return _PY_CreateDeviceInfoList()
 #------------------------------------------------------------------------------
 
 def get_device_info_detail(dev=0):
@@ -235,7 +271,7 @@ def get_device_info_detail(dev=0):
     lpdwLocId = c.c_ulong()
     pcSerialNumber = c.c_buffer(MAX_DESCRIPTION_SIZE)
     pcDescription = c.c_buffer(MAX_DESCRIPTION_SIZE)
-    ftHandle = c.c_ulong()
+    ftHandle = FT_HANDLE()
     _PY_GetDeviceInfoDetail(dwIndex,
                                 c.byref(lpdwFlags),
                                 c.byref(lpdwType),
@@ -272,7 +308,7 @@ def get_device_info_list():
 def open_ex(serial=''):
     '''open's FTDI-device by EEPROM-serial (prefered method).
     Serial fetched by the ListDevices fn'''
-    ftHandle = c.c_ulong()
+    ftHandle = FT_HANDLE()
     dw_flags = c.c_ulong(FT_OPEN_BY_SERIAL_NUMBER)
     _PY_OpenEx(serial, dw_flags, c.byref(ftHandle))
     return FTD2XX(ftHandle)
@@ -282,11 +318,45 @@ def open_ex(serial=''):
 def open_ex_by_name(name):
     '''open's FTDI-device by EEPROM-serial (prefered method).
     Serial fetched by the ListDevices fn'''
-    ftHandle = c.c_ulong()
+    ftHandle = FT_HANDLE()
     dw_flags = c.c_ulong(FT_OPEN_BY_DESCRIPTION)
     _PY_OpenEx(c.c_char_p(name), dw_flags, c.byref(ftHandle))
     return FTD2XX(ftHandle)
 
+#------------------------------------------------------------------------------
+#
+# Receive event - signalled by the driver when data arrives in the RX queue
+#
+# Only Windows events are supported. On other platforms the d2xx library
+# expects a pthread condition/mutex structure, and FTD2XX.rx_event()
+# returns None.
+
+class RxEvent(object):
+
+    def __init__(self, ftHandle):
+        kernel32 = c.windll.kernel32
+
+        # HANDLEs are pointer sized, declared so they aren't truncated to
+        # an int on 64-bit Windows
+        kernel32.CreateEventA.restype = c.c_void_p
+        kernel32.CreateEventA.argtypes = [c.c_void_p, c.c_int, c.c_int,
+                                          c.c_char_p]
+        kernel32.WaitForSingleObject.argtypes = [c.c_void_p, c.c_ulong]
+        kernel32.CloseHandle.argtypes = [c.c_void_p]
+
+        self.handle = c.c_void_p(kernel32.CreateEventA(None, 0, 0, None))
+        _PY_SetEventNotification(ftHandle, c.c_ulong(FT_EVENT_RXCHAR),
+                                 self.handle)
+
+    def wait(self, timeout):
+        '''wait up to timeout seconds, returns True if signalled'''
+        result = c.windll.kernel32.WaitForSingleObject(self.handle,
+                                                       int(timeout * 1000))
+        return result == WAIT_OBJECT_0
+
+    def close(self):
+        c.windll.kernel32.CloseHandle(self.handle)
+
 #------------------------------------------------------------------------------
 #
 # FTDI ctypes DLL wrappers
@@ -297,6 +367,9 @@ class FTD2XX(object):
     def __init__(self, ftHandle):
         '''setup initial ctypes link and some varabled'''
         self.ftHandle = ftHandle
+        
+        # Reused by read()
+        self.scratch = c.create_string_buffer(4096)
 
 #------------------------------------------------------------------------------
 
@@ -352,27 +425,71 @@ class FTD2XX(object):
     def get_queue_status(self):
         '''returns the number of bytes in the RX buffer
         else raises an exception'''
-        lpdwAmountInRxQueue = c.c_ulong()
-        _PY_GetQueueStatus(self.ftHandle, c.byref(lpdwAmountInRxQueue))
-        return lpdwAmountInRxQueue.value
+        return _PY_GetQueueStatus(self.ftHandle)
+
+#------------------------------------------------------------------------------
+
+    def get_device_info(self):
+        '''returns the type, ID, serial number and description of
+        the open device'''
+        ftDevice = c.c_ulong()
+        dwID = c.c_ulong()
+        pcSerialNumber = c.c_buffer(16)
+        pcDescription = c.c_buffer(64)
+        _PY_GetDeviceInfo(self.ftHandle, c.byref(ftDevice), c.byref(dwID),
+                          pcSerialNumber, pcDescription, None)
+        return {'Type': ftDevice.value,
+                'ID': dwID.value,
+                'SerialNumber': pcSerialNumber.value,
+                'Description': pcDescription.value}
+
+#------------------------------------------------------------------------------
+
+    def rx_event(self):
+        '''returns an RxEvent signalled when data is received,
+        or None where the driver's event notification isn't supported'''
+        if sys.platform == 'win32':
+            return RxEvent(self.ftHandle)
+        return None
 
 #------------------------------------------------------------------------------
 
     def write(self, lpBuffer=''):
         '''writes the string-type "data" to the opened port.'''
-        lpdwBytesWritten = c.c_ulong()
-        _PY_Write(self.ftHandle, lpBuffer, len(lpBuffer), c.byref(lpdwBytesWritten))
-        return lpdwBytesWritten.value
+        return _PY_Write(self.ftHandle, lpBuffer, len(lpBuffer))
+
+#------------------------------------------------------------------------------
+
+    def write_from(self, data, offset=0, size=None):
+        '''writes size bytes of data from offset without copying.
+        data is a bytearray, a writable buffer or a str'''
+        if size is None:
+            size = len(data) - offset
+        if isinstance(data, str):
+            lpBuffer = data[offset:offset + size] if offset or size < len(data) else data
+        else:
+            lpBuffer = (c.c_char * size).from_buffer(data, offset)
+        return _PY_Write(self.ftHandle, lpBuffer, size)
 
 #------------------------------------------------------------------------------
 
     def read(self, dwBytesToRead, raw=True):
         '''Read in int-type of bytes. Returns either the data
         or raises an exception'''
-        lpdwBytesReturned = c.c_ulong(0)
-        lpBuffer = c.c_buffer(dwBytesToRead)
-        _PY_Read(self.ftHandle, lpBuffer, dwBytesToRead, c.byref(lpdwBytesReturned))
-        return lpBuffer.raw[:lpdwBytesReturned.value] if raw else lpBuffer.value[:lpdwBytesReturned.value]
+        if c.sizeof(self.scratch) < dwBytesToRead:
+            self.scratch = c.create_string_buffer(dwBytesToRead)
+        n = _PY_Read(self.ftHandle, self.scratch, dwBytesToRead)
+        return c.string_at(self.scratch, n) if raw else self.scratch.value[:n]
+
+#------------------------------------------------------------------------------
+
+    def read_into(self, buffer, offset=0, size=None):
+        '''reads up to size bytes into a bytearray or writable buffer at
+        offset, without copying. Returns the number of bytes read'''
+        if size is None:
+            size = len(buffer) - offset
+        lpBuffer = (c.c_char * size).from_buffer(buffer, offset)
+        return _PY_Read(self.ftHandle, lpBuffer, size)
 
 #------------------------------------------------------------------------------
 
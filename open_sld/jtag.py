@@ -0,0 +1,28 @@
+#------------------------------------------------------------------------------
+#
+#   jtag.py
+#
+#   The JTAG TAP controller state machine, shared by the simulator and
+#   245_decode.py
+#
+#------------------------------------------------------------------------------
+
+# JTAG state transitions, [TMS = 0, TMS = 1]
+JTAG_STATES = {
+    'capture_dr': ['shift_dr', 'exit1_dr'],
+    'capture_ir': ['shift_ir', 'exit1_ir'],
+    'exit1_dr':   ['pause_dr', 'update_dr'],
+    'exit1_ir':   ['pause_ir', 'update_ir'],
+    'exit2_dr':   ['shift_dr', 'update_dr'],
+    'exit2_ir':   ['shift_ir', 'update_ir'],
+    'idle':       ['idle', 'select_dr'],
+    'pause_dr':   ['pause_dr', 'exit2_dr'],
+    'pause_ir':   ['pause_ir', 'exit2_ir'],
+    'reset':      ['idle', 'reset'],
+    'select_dr':  ['capture_dr', 'select_ir'],
+    'select_ir':  ['capture_ir', 'reset'],
+    'shift_dr':   ['shift_dr', 'exit1_dr'],
+    'shift_ir':   ['shift_ir', 'exit1_ir'],
+    'update_dr':  ['idle', 'select_dr'],
+    'update_ir':  ['idle', 'select_dr']
+}
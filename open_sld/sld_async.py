@@ -0,0 +1,220 @@
+#------------------------------------------------------------------------------
+#
+#   sld_async.py
+#
+#   An asyncio front-end for SLD_Controller
+#
+#------------------------------------------------------------------------------
+
+import threading
+import Queue
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from .sld_interface import SLD_Controller
+
+#------------------------------------------------------------------------------
+#
+# AsyncSLDController
+#
+# The SLD_Controller, and so the FTD2XX handle, belong to a dedicated I/O
+# thread. Each method queues one operation for that thread and returns an
+# asyncio Future for its result, so the event loop keeps running while the
+# USB transfer is in flight. Operations run and complete in the order they
+# were called.
+#
+# At most max_pending operations are handed to the I/O thread at a time,
+# and up to max_waiting more wait in the loop. Beyond that an operation's
+# Future fails at once with SLDQueueFullError. drain() returns a Future
+# that completes when fewer than max_pending operations are outstanding,
+# for producers that need to slow down. Operations called after close()
+# fail with SLDClosedError.
+#
+# All methods must be called from the event loop's thread.
+
+class SLDQueueFullError(Exception):
+    pass
+
+class SLDClosedError(Exception):
+    pass
+
+#----
+
+class AsyncSLDController(object):
+
+    def __init__(self, interface_name, m_width, n_width, loop=None,
+                 max_pending=64, max_waiting=1024, **kwargs):
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        self.max_pending = max_pending
+        self.max_waiting = max_waiting
+        self.closed      = False
+        self.in_flight   = 0
+        self.waiting     = deque()
+        self.drainers    = []
+
+        # Work for the I/O thread, None stops it
+        self.requests = Queue.Queue()
+
+        self.sld        = None
+        self.open_error = None
+        self.ready      = threading.Event()
+
+        self.thread = threading.Thread(target=self.io_thread,
+                                       args=(interface_name, m_width, n_width,
+                                             kwargs))
+        self.thread.daemon = True
+        self.thread.start()
+
+        # Wait for the device to open, so open errors are raised here
+        self.ready.wait()
+        if self.open_error is not None:
+            raise self.open_error
+
+    #----
+    #
+    # The SLD operations, each returns a Future
+
+    def tap_reset(self):
+        return self.submit('TAP_Reset')
+
+    def ir_write(self, instruction):
+        return self.submit('IR_Write', instruction)
+
+    def vir_write(self, node, instruction):
+        return self.submit('VIR_Write', node, instruction)
+
+    def vdr_write(self, data, size=None):
+        return self.submit('VDR_Write', data, size)
+
+    def vdr_read(self, size):
+        return self.submit('VDR_Read', size)
+
+    def vdr_write_read(self, data, size=None):
+        return self.submit('VDR_Write_Read', data, size)
+
+    #----
+    #
+    # Run fn(sld, *args) on the I/O thread, in order with the other
+    # operations. Returns a Future for its result.
+
+    def call(self, fn, *args):
+        return self.submit(fn, *args)
+
+    #----
+    #
+    # Close the device after all queued operations. Returns a Future. The
+    # close is queued even when the queue is full.
+
+    def close(self):
+
+        if self.closed:
+            return self.submit(None)
+
+        future = asyncio.Future(loop=self.loop)
+        self.waiting.append((future, None, ()))
+        self.closed = True
+        self.dispatch()
+        return future
+
+    #----
+
+    def drain(self):
+
+        future = asyncio.Future(loop=self.loop)
+        if self.outstanding() < self.max_pending:
+            future.set_result(None)
+        else:
+            self.drainers.append(future)
+        return future
+
+    #----
+
+    def outstanding(self):
+        return self.in_flight + len(self.waiting)
+
+    #----
+
+    def submit(self, method, *args):
+
+        future = asyncio.Future(loop=self.loop)
+        if self.closed:
+            future.set_exception(SLDClosedError('controller is closed'))
+        elif (self.in_flight >= self.max_pending and
+              len(self.waiting) >= self.max_waiting):
+            future.set_exception(SLDQueueFullError(
+                '%d operations outstanding' % self.outstanding()))
+        else:
+            self.waiting.append((future, method, args))
+            self.dispatch()
+        return future
+
+    #----
+    #
+    # Hand waiting operations to the I/O thread while there is room
+
+    def dispatch(self):
+
+        while self.waiting and self.in_flight < self.max_pending:
+            self.in_flight += 1
+            self.requests.put(self.waiting.popleft())
+
+        if self.outstanding() < self.max_pending:
+            drainers, self.drainers = self.drainers, []
+            for future in drainers:
+                if not future.done():
+                    future.set_result(None)
+
+    #----
+    #
+    # Called in the loop's thread when the I/O thread finishes an operation
+
+    def complete(self, future, result, error):
+
+        self.in_flight -= 1
+        if not future.cancelled():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        self.dispatch()
+
+    #----
+    #
+    # I/O thread
+
+    def io_thread(self, interface_name, m_width, n_width, kwargs):
+
+        try:
+            self.sld = SLD_Controller(interface_name, m_width, n_width, **kwargs)
+        except Exception as e:
+            self.open_error = e
+            self.ready.set()
+            return
+        self.ready.set()
+
+        while True:
+            future, method, args = self.requests.get()
+
+            result = error = None
+            try:
+                if method is None:
+                    self.sld.close()
+                elif callable(method):
+                    result = method(self.sld, *args)
+                else:
+                    result = getattr(self.sld, method)(*args)
+            except Exception as e:
+                error = e
+
+            self.loop.call_soon_threadsafe(self.complete, future, result, error)
+
+            if method is None:
+                break
@@ -0,0 +1,399 @@
+#------------------------------------------------------------------------------
+#
+#   sld_capture.py
+#
+#   Streaming capture from a virtual JTAG node
+#
+#   VDRCapture selects a node and instruction once, then shifts the node's
+#   DR back to back. Scans are sent in batches, with the next batch queued
+#   in the driver before the last one is read, so the USB link stays busy
+#   while Python decodes. Samples go to a fixed-size ring buffer, which can
+#   be a memory-mapped file read by another process.
+#
+#   Single threaded:
+#
+#       capture = VDRCapture(sld, 1, 2, 32)
+#       for samples in capture.batches():
+#           ...
+#
+#   On a capture thread, with callbacks and a ring buffer:
+#
+#       with VDRCapture(sld, 1, 2, 32, depth=1 << 20,
+#                       callbacks=[plot]) as capture:
+#           for sample in capture:
+#               ...
+#
+#   The SLD_Controller must not be used by anything else while a capture
+#   is running.
+#
+#------------------------------------------------------------------------------
+
+import threading
+from time import time
+
+from .bits import to_bits
+from .sld_interface import (TAP_SHIFT_DR, TAP_END_SHIFT, USER0, byte_split,
+                            tdo_value, load_numpy)
+
+# Scans per USB write
+DEFAULT_BATCH = 256
+
+# Batches written ahead of the one being read
+IN_FLIGHT = 2
+
+# Memory-mapped ring file header, in 64-bit words:
+#   magic, sample width, depth, samples written
+RING_MAGIC  = 0x474E495253444C53    # 'SLDSRING', little-endian
+RING_HEADER = 4
+
+#------------------------------------------------------------------------------
+#
+# Ring buffer
+#
+# Holds the last depth samples. Samples of up to 64 bits are kept in a
+# NumPy uint64 array, memory-mapped if file_name is given; wider samples,
+# or any without NumPy, in a list of ints. A reader that falls more than
+# depth samples behind loses the oldest, counted in dropped.
+
+class SampleRing(object):
+
+    def __init__(self, depth, width, file_name=None):
+
+        self.depth   = depth
+        self.width   = width
+        self.written = 0
+        self.read_at = 0
+        self.dropped = 0
+
+        np = load_numpy() if width <= 64 else None
+        if file_name is not None and not np:
+            raise ValueError('memory-mapped rings need NumPy and samples of '
+                             'up to 64 bits')
+
+        if file_name is not None:
+            self.header = np.memmap(file_name, dtype=np.uint64, mode='w+',
+                                    shape=(RING_HEADER + depth,))
+            self.header[:3] = (RING_MAGIC, width, depth)
+            self.samples = self.header[RING_HEADER:]
+        elif np:
+            self.header  = None
+            self.samples = np.zeros(depth, dtype=np.uint64)
+        else:
+            self.header  = None
+            self.samples = [0] * depth
+
+    #----
+
+    def extend(self, values):
+
+        n = len(values)
+        if n > self.depth:
+            values = values[n - self.depth:]
+            self.written += n - self.depth
+            n = self.depth
+
+        start = self.written % self.depth
+        first = min(n, self.depth - start)
+        self.samples[start:start + first] = values[:first]
+        self.samples[:n - first] = values[first:]
+        self.written += n
+
+        if self.header is not None:
+            self.header[3] = self.written
+
+    #----
+    #
+    # Samples written since the last take(), oldest first, at most count
+
+    def take(self, count=None):
+
+        if self.written - self.read_at > self.depth:
+            self.dropped += self.written - self.read_at - self.depth
+            self.read_at = self.written - self.depth
+
+        n = self.written - self.read_at
+        if count is not None:
+            n = min(n, count)
+
+        start = self.read_at % self.depth
+        first = min(n, self.depth - start)
+        result = self.samples[start:start + first]
+        if first < n:
+            result = list(result) + list(self.samples[:n - first])
+        self.read_at += n
+        return list(result)
+
+    #----
+
+    def available(self):
+        return min(self.written - self.read_at, self.depth)
+
+    #----
+
+    def close(self):
+        if self.header is not None:
+            self.header.flush()
+            self.header = None
+
+#----
+#
+# Read a memory-mapped ring written by another process. Returns (width,
+# samples written, the samples held oldest first).
+
+def read_ring_file(file_name):
+
+    np = load_numpy()
+    words = np.memmap(file_name, dtype=np.uint64, mode='r')
+    if len(words) < RING_HEADER or words[0] != RING_MAGIC:
+        raise ValueError('%s is not a sample ring file' % file_name)
+
+    width, depth, written = [int(w) for w in words[1:RING_HEADER]]
+    samples = words[RING_HEADER:RING_HEADER + depth]
+
+    start = written % depth
+    held = np.concatenate((samples[start:], samples[:start]))
+    return width, written, held[depth - min(written, depth):]
+
+#------------------------------------------------------------------------------
+#
+# VDRCapture
+#
+# data is shifted into the DR on every scan, default all zeros. Samples
+# are ints. callbacks are called on the capture thread as fn(samples)
+# with each batch, samples is a NumPy array or list. Pass them to the
+# constructor to receive every batch, add_callback() while a capture is
+# running can miss the first.
+
+class VDRCapture(object):
+
+    def __init__(self, sld, node, instruction, width, data=0, batch=DEFAULT_BATCH,
+                 depth=65536, file_name=None, callbacks=()):
+
+        self.sld         = sld
+        self.node        = node
+        self.instruction = instruction
+        self.width       = width
+        self.batch       = batch
+
+        self.ring      = SampleRing(depth, width, file_name)
+        self.callbacks = list(callbacks)
+
+        # One scan: Idle to Shift-DR, shift and read width bits, back to Idle
+        bits = to_bits(data, width)
+        scan = ''.join([buffer(TAP_SHIFT_DR)[:], sld.shiftBuffer(bits, True),
+                        buffer(TAP_END_SHIFT)[:]])
+        self.batch_command = scan * batch
+
+        if sld.byte_mode:
+            self.n_bytes, self.n_bits = byte_split(width)
+        else:
+            self.n_bytes, self.n_bits = 0, width
+        self.sample_bytes = self.n_bytes + self.n_bits
+
+        # Capture thread
+        self.thread   = None
+        self.running  = False
+        self.stopping = False
+        self.error    = None
+        self.ready    = threading.Condition()
+
+        # Totals
+        self.samples    = 0
+        self.start_time = None
+        self.stop_time  = None
+
+    #----
+
+    def add_callback(self, fn):
+        self.callbacks.append(fn)
+
+    def remove_callback(self, fn):
+        self.callbacks.remove(fn)
+
+    #----
+    #
+    # Select the node's DR, leaving the JTAG IR holding USER0
+
+    def select(self):
+        sld = self.sld
+        sld.load_vir(self.node, self.instruction)
+        sld.load_ir(USER0)
+        sld.queue.flush()
+
+    #----
+    #
+    # Generator of decoded batches, count batches or until stop(). Keeps IN_FLIGHT batches queued ahead of the one being read,
+    # and reads them all before returning, so the stream stays in step.
+
+    def batches(self, count=None):
+
+        sld = self.sld
+        self.select()
+
+        read_size = self.sample_bytes * self.batch
+        sent = 0
+        received = 0
+        self.start_time = time()
+        try:
+            while count is None or received < count:
+
+                while sent - received < IN_FLIGHT and (count is None or sent < count):
+                    sld.queue.write(self.batch_command)
+                    sld.queue.flush()
+                    sent += 1
+
+                rx_data = sld.read_bytes(read_size)
+                received += 1
+
+                # Keep the pipeline full while this batch is decoded
+                if count is None or sent < count:
+                    sld.queue.write(self.batch_command)
+                    sld.queue.flush()
+                    sent += 1
+
+                samples = self.decode(rx_data)
+                self.samples += len(samples)
+                yield samples
+
+                if self.stopping:
+                    break
+        finally:
+            # Read what is still in flight and drop it
+            while received < sent:
+                sld.read_bytes(read_size)
+                received += 1
+            self.stop_time = time()
+
+    #----
+    #
+    # Decode a batch of read data to a NumPy uint64 array, or a list of
+    # ints for samples wider than 64 bits or without NumPy
+
+    def decode(self, rx_data):
+
+        n_bytes, n_bits = self.n_bytes, self.n_bits
+        np = load_numpy() if self.width <= 64 else None
+
+        if not np:
+            size = self.sample_bytes
+            return [tdo_value(rx_data[i:i + size], n_bytes, n_bits)
+                    for i in range(0, size * self.batch, size)]
+
+        rx = np.frombuffer(rx_data, dtype=np.uint8).reshape(self.batch,
+                                                             self.sample_bytes)
+
+        # Byte-mode bytes are the sample's low bytes, LSB first
+        padded = np.zeros((self.batch, 8), dtype=np.uint8)
+        padded[:, :n_bytes] = rx[:, :n_bytes]
+        values = padded.view('<u8').ravel()
+
+        # Bit-mode bytes hold one bit each above them
+        for i in range(n_bits):
+            bit = (rx[:, n_bytes + i] & 1).astype(np.uint64)
+            values |= bit << np.uint64(8 * n_bytes + i)
+        return values
+
+    #----
+    #
+    # Start the capture thread
+
+    def start(self):
+
+        if self.thread is not None:
+            raise RuntimeError('capture already running')
+
+        self.running  = True
+        self.stopping = False
+        self.error    = None
+        self.thread  = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    #----
+    #
+    # Stop the capture thread, after the batches in flight are read
+
+    def stop(self):
+
+        if self.thread is None:
+            return
+
+        self.stopping = True
+        self.thread.join()
+        self.thread = None
+
+        if self.error is not None:
+            raise self.error
+
+    #----
+    #
+    # Capture thread
+
+    def run(self):
+
+        try:
+            for samples in self.batches():
+                with self.ready:
+                    self.ring.extend(samples)
+                    self.ready.notify_all()
+                for fn in self.callbacks:
+                    fn(samples)
+        except Exception as e:
+            self.error = e
+
+        with self.ready:
+            self.running = False
+            self.ready.notify_all()
+
+    #----
+    #
+    # Samples not yet read, oldest first, waiting up to timeout seconds for
+    # at least one. Returns an empty list if there are none.
+
+    def read(self, count=None, timeout=None):
+
+        with self.ready:
+            if not self.ring.available() and self.running:
+                self.ready.wait(timeout)
+            return [int(v) for v in self.ring.take(count)]
+
+    #----
+    #
+    # Samples as they arrive, until the capture stops
+
+    def __iter__(self):
+
+        while True:
+            samples = self.read(timeout=1.0)
+            for sample in samples:
+                yield sample
+            if not samples and not self.running:
+                if self.error is not None:
+                    raise self.error
+                return
+
+    #----
+    #
+    # Samples per second over the capture so far
+
+    def rate(self):
+        if self.start_time is None:
+            return 0.0
+        end = self.stop_time if self.stop_time is not None else time()
+        return self.samples / max(end - self.start_time, 1e-9)
+
+    #----
+
+    def close(self):
+        self.stop()
+        self.ring.close()
+
+    #----
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,385 @@
+#------------------------------------------------------------------------------
+#
+#   sld_config.py
+#
+#   FPGA configuration over JTAG, without quartus_pgm
+#
+#   The bitstream is taken from a Quartus .sof (or a raw .rbf) and shifted
+#   into the Cyclone's configuration DR through the SLD_Controller's open
+#   USB-Blaster, in byte-shift mode:
+#
+#       PROGRAM, idle clocks while the device clears
+#       Shift-DR the bitstream, LSB of each byte first
+#       STARTUP, idle clocks to initialize
+#       BYPASS
+#
+#   The device is then checked: it only enters user mode, where its SLD
+#   hub answers with Altera's manufacturer ID, once CONF_DONE is set and
+#   initialization has finished.
+#
+#   Before configuring, the IDCODE, USERCODE and SLD hub nodes are read and
+#   compared with the fingerprint recorded the last time this device was
+#   configured with the same bitstream. If they match, the design is
+#   already loaded and configuration is skipped.
+#
+#   sld = SLD_Controller('USB-Blaster', 4, 1)
+#   sld.configure('InitialTest.sof')
+#
+#------------------------------------------------------------------------------
+
+import hashlib
+import os
+import struct
+
+from .bits import BitVector
+from .sld_hub import HubInfo, load_json, save_json
+from .sld_interface import (TAP_SHIFT_DR, TAP_END_SHIFT, TCK_LOW, sHM,
+                            MAX_SHIFT_BYTES, BIT_PAIRS, BIT_TABLE, byte_split,
+                            tail_bits)
+
+#------------------------------------------------------------------------------
+#
+# Globals
+
+# Cyclone JTAG instructions, 10 bits
+IR_PROGRAM      = 0x002
+IR_STARTUP      = 0x003
+IR_CHECK_STATUS = 0x004
+IR_IDCODE       = 0x006
+IR_USERCODE     = 0x007
+IR_BYPASS       = 0x3FF
+
+# TCK cycles in Run-Test/Idle after PROGRAM, while configuration memory
+# is cleared, and after STARTUP (Cyclone IV needs 3,192 to initialize)
+PROGRAM_CLOCKS = 12000
+INIT_CLOCKS    = 3200
+BYPASS_CLOCKS  = 32
+
+# IDCODEs, without the version nibble, by device name prefix
+DEVICE_IDCODES = {
+    'EP4CE6':   0x020F10DD,
+    'EP4CE10':  0x020F10DD,
+    'EP4CE15':  0x020F20DD,
+    'EP4CE22':  0x020F30DD,
+    'EP4CE30':  0x020F40DD,
+    'EP4CE40':  0x020F40DD,
+    'EP4CE55':  0x020F50DD,
+    'EP4CE75':  0x020F60DD,
+    'EP4CE115': 0x020F70DD,
+}
+
+IDCODE_MASK = 0x0FFFFFFF
+
+# .sof sections
+SOF_MAGIC          = 'SOF\x00'
+SOF_HEADER         = 12
+SOF_SECTION        = struct.Struct('<HI')
+SOF_VERSION        = 1
+SOF_DEVICE         = 2
+SOF_BITSTREAM      = 0x11
+BITSTREAM_HEADER   = 12
+BITSTREAM_BITS_AT  = 6
+
+# Bitstream bytes per queued write
+CHUNK_BYTES = MAX_SHIFT_BYTES * 1024
+
+DEFAULT_FINGERPRINT_FILE = os.path.expanduser('~/.open_sld_fingerprints.json')
+
+#------------------------------------------------------------------------------
+
+class ConfigurationError(Exception):
+    pass
+
+#------------------------------------------------------------------------------
+#
+# A configuration bitstream: data shifted LSB of each byte first, bits
+# long. device and version are from the .sof, None for an .rbf.
+
+class Bitstream(object):
+
+    def __init__(self, data, bits=None, device=None, version=None):
+
+        if bits is None:
+            bits = 8 * len(data)
+        if bits > 8 * len(data):
+            raise ConfigurationError('%d bytes hold fewer than %d bits'
+                                     % (len(data), bits))
+        self.data    = data
+        self.bits    = bits
+        self.device  = device
+        self.version = version
+
+    #----
+    #
+    # The expected IDCODE, None for an unknown device
+
+    def idcode(self):
+        if self.device is None:
+            return None
+        for name in sorted(DEVICE_IDCODES, key=len, reverse=True):
+            rest = self.device[len(name):]
+            if self.device.startswith(name) and not rest[:1].isdigit():
+                return DEVICE_IDCODES[name]
+        return None
+
+    #----
+    #
+    # Identifies the bitstream in the fingerprint cache
+
+    def digest(self):
+        return hashlib.sha1('%d:%s' % (self.bits, self.data)).hexdigest()
+
+    #----
+
+    def __repr__(self):
+        return '<Bitstream %s, %d bits>' % (self.device or 'raw', self.bits)
+
+#----
+#
+# The sections of a .sof are a 16-bit tag and a 32-bit length, followed by
+# that many bytes. The bitstream section starts with a 12 byte header that
+# holds its length in bits.
+
+def read_sof(file_name):
+
+    with open(file_name, 'rb') as f:
+        sof = f.read()
+
+    if sof[:len(SOF_MAGIC)] != SOF_MAGIC:
+        raise ConfigurationError('%s is not a .sof file' % file_name)
+
+    sections = {}
+    offset = SOF_HEADER
+    while offset + SOF_SECTION.size <= len(sof):
+        tag, length = SOF_SECTION.unpack_from(sof, offset)
+        offset += SOF_SECTION.size
+        sections.setdefault(tag, sof[offset:offset + length])
+        offset += length
+
+    if SOF_BITSTREAM not in sections:
+        raise ConfigurationError('%s has no bitstream' % file_name)
+
+    section = sections[SOF_BITSTREAM]
+    bits = struct.unpack_from('<I', section, BITSTREAM_BITS_AT)[0]
+    data = section[BITSTREAM_HEADER:BITSTREAM_HEADER + (bits + 7) // 8]
+
+    return Bitstream(data, bits,
+                     sections.get(SOF_DEVICE, '').rstrip('\x00') or None,
+                     sections.get(SOF_VERSION, '').rstrip('\x00') or None)
+
+#----
+
+def read_rbf(file_name):
+    with open(file_name, 'rb') as f:
+        return Bitstream(f.read())
+
+#----
+#
+# A .sof, or anything else as an .rbf
+
+def read_bitstream(file_name):
+    with open(file_name, 'rb') as f:
+        is_sof = f.read(len(SOF_MAGIC)) == SOF_MAGIC
+    return read_sof(file_name) if is_sof else read_rbf(file_name)
+
+#------------------------------------------------------------------------------
+#
+# Command streams
+
+# count TCK cycles with TMS = 0, which stays in Run-Test/Idle. In byte-shift
+# mode each zero byte is 8 cycles.
+
+def idle_clocks(count, byte_mode=True):
+
+    data = []
+    if byte_mode and count >= 8:
+        n_bytes = count // 8
+        data.append(TCK_LOW)
+        for i in range(0, n_bytes, MAX_SHIFT_BYTES):
+            n = min(MAX_SHIFT_BYTES, n_bytes - i)
+            data.append(chr(sHM | n) + '\x00' * n)
+        count -= 8 * n_bytes
+
+    data.append(BIT_PAIRS[0] * count)
+    return ''.join(data)
+
+#----
+#
+# Generator of the command bytes that shift a bitstream from Shift-DR to
+# Exit1-DR, in pieces of about CHUNK_BYTES of bitstream
+
+def shift_stream(bitstream, byte_mode=True):
+
+    data = bitstream.data
+    n_bytes, n_bits = byte_split(bitstream.bits)
+
+    if byte_mode and n_bytes:
+        yield TCK_LOW
+    for start in range(0, n_bytes, CHUNK_BYTES):
+        chunk = data[start:min(start + CHUNK_BYTES, n_bytes)]
+        if byte_mode:
+            yield ''.join([chr(sHM | len(chunk[i:i + MAX_SHIFT_BYTES])) +
+                           chunk[i:i + MAX_SHIFT_BYTES]
+                           for i in range(0, len(chunk), MAX_SHIFT_BYTES)])
+        else:
+            yield ''.join([BIT_TABLE[b] for b in bytearray(chunk)])
+
+    # The last bits in bit-mode, ending with TMS = 1
+    yield ''.join(tail_bits(ord(data[n_bytes]), 0, n_bits, False))
+
+#------------------------------------------------------------------------------
+#
+# JTAG instructions
+
+def read_idcode(sld):
+    sld.IR_Write(BitVector(IR_IDCODE, 10))
+    return sld.DR_Write_Read(0, 32).uint
+
+def read_usercode(sld):
+    sld.IR_Write(BitVector(IR_USERCODE, 10))
+    return sld.DR_Write_Read(0, 32).uint
+
+#----
+#
+# What a configured device reports: IDCODE, USERCODE and its SLD hub
+# topology, as a dict that can be stored as JSON
+
+def read_fingerprint(sld):
+    return {'idcode':   read_idcode(sld),
+            'usercode': read_usercode(sld),
+            'hub':      sld.enumerate_hub().to_dict()}
+
+#----
+#
+# The fingerprint of a device in user mode. Raises ConfigurationError if
+# its SLD hub doesn't answer, i.e. CONF_DONE isn't set or the design
+# didn't start.
+
+def check_configured(sld):
+
+    fingerprint = read_fingerprint(sld)
+    hub = HubInfo.from_dict(fingerprint['hub'])
+    if not hub.valid():
+        raise ConfigurationError('device is not in user mode after '
+                                 'configuration (HUB_INFO manufacturer 0x%03X, '
+                                 'USERCODE 0x%08x)'
+                                 % (hub.manufacturer, fingerprint['usercode']))
+    return fingerprint
+
+#------------------------------------------------------------------------------
+#
+# Fingerprint cache
+#
+# The last bitstream each device was configured with, and the fingerprint
+# it read back afterwards, stored as JSON keyed by device serial number.
+# Saved like the TopologyCache.
+
+class FingerprintCache(object):
+
+    def __init__(self, file_name=DEFAULT_FINGERPRINT_FILE):
+        self.file_name = file_name
+        self.entries   = load_json(file_name)
+
+    #----
+    #
+    # The fingerprint expected from device with bitstream loaded, None if
+    # it isn't known
+
+    def get(self, device, digest):
+        entry = self.entries.get(device)
+        if entry is None or entry['bitstream'] != digest:
+            return None
+        return entry['fingerprint']
+
+    #----
+
+    def put(self, device, digest, fingerprint):
+        self.entries = load_json(self.file_name)
+        self.entries[device] = {'bitstream': digest,
+                                'fingerprint': fingerprint}
+        self.save()
+
+    #----
+
+    def forget(self, device):
+        self.entries = load_json(self.file_name)
+        if self.entries.pop(device, None) is not None:
+            self.save()
+
+    #----
+
+    def save(self):
+        save_json(self.file_name, self.entries)
+
+#------------------------------------------------------------------------------
+#
+# Configure the FPGA on sld's JTAG chain from a .sof or .rbf file name, or
+# a Bitstream, unless the device's fingerprint shows it is already
+# configured with it. Pass force=True, or fingerprint_file=None, to always
+# configure. Devices without a serial number are always configured too.
+# Returns True if the device was configured, False if it was skipped.
+
+def configure(sld, bitstream, fingerprint_file=DEFAULT_FINGERPRINT_FILE,
+              force=False):
+
+    if not isinstance(bitstream, Bitstream):
+        bitstream = read_bitstream(bitstream)
+
+    device = sld.serial_number
+    cache = None
+    if fingerprint_file and device is not None:
+        cache = FingerprintCache(fingerprint_file)
+
+    if cache is not None and not force:
+        expected = cache.get(device, bitstream.digest())
+        if expected is not None and read_fingerprint(sld) == expected:
+            return False
+
+    # Only a device that reached user mode is recorded, and one that
+    # didn't is forgotten
+    try:
+        fingerprint = program(sld, bitstream)
+    except ConfigurationError:
+        if cache is not None:
+            cache.forget(device)
+        raise
+
+    if cache is not None:
+        cache.put(device, bitstream.digest(), fingerprint)
+    return True
+
+#----
+#
+# Configure the FPGA from a Bitstream. Raises ConfigurationError if the
+# IDCODE doesn't match the .sof's device, or the device doesn't reach user
+# mode. Returns the configured device's fingerprint.
+
+def program(sld, bitstream):
+
+    expected = bitstream.idcode()
+    if expected is not None:
+        idcode = read_idcode(sld)
+        if idcode & IDCODE_MASK != expected & IDCODE_MASK:
+            raise ConfigurationError('IDCODE 0x%08x does not match %s'
+                                     % (idcode, bitstream.device))
+
+    byte_mode = sld.byte_mode
+    with sld.queue:
+        sld.load_ir(BitVector(IR_PROGRAM, 10))
+        sld.queue.write(idle_clocks(PROGRAM_CLOCKS, byte_mode))
+
+        sld.queue.write(TAP_SHIFT_DR)
+        for data in shift_stream(bitstream, byte_mode):
+            sld.queue.write(data)
+        sld.queue.write(TAP_END_SHIFT)
+
+        sld.load_ir(BitVector(IR_STARTUP, 10))
+        sld.queue.write(idle_clocks(INIT_CLOCKS, byte_mode))
+        sld.load_ir(BitVector(IR_BYPASS, 10))
+        sld.queue.write(idle_clocks(BYPASS_CLOCKS, byte_mode))
+
+    # The SLD hub is the new design's, and nothing is selected in it
+    sld.invalidate()
+    sld.hub = None
+
+    return check_configured(sld)
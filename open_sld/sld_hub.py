@@ -0,0 +1,243 @@
+#------------------------------------------------------------------------------
+#
+#   sld_hub.py
+#
+#   SLD hub and node information, and a cache of discovered topologies
+#
+#------------------------------------------------------------------------------
+
+import json
+import os
+import sys
+import tempfile
+import threading
+
+#------------------------------------------------------------------------------
+#
+# Hub enumeration
+#
+# With the hub's virtual IR set to HUB_INFO (address 0, instruction 0),
+# each 4-bit DR scan through USER0 returns the next nibble of the hub
+# information, LSB nibble first. Eight scans give the 32-bit HUB_INFO
+# word, and each following group of eight gives one node's NODE_INFO.
+#
+#   HUB_INFO:  [31:27] hub IP version  [26:19] node count
+#              [18:8]  manufacturer    [7:0]   m, the virtual IR width
+#
+#   NODE_INFO: [31:27] node version    [26:19] node ID
+#              [18:8]  manufacturer    [7:0]   instance
+
+HUB_INFO = 0
+
+NIBBLES_PER_WORD = 8
+
+# Long enough to clear any hub's virtual IR
+VIR_CLEAR_BITS = 64
+
+ALTERA_MANUFACTURER = 0x06E
+
+DEFAULT_TOPOLOGY_FILE = os.path.expanduser('~/.open_sld_topology.json')
+
+#----
+#
+# JSON cache files
+#
+# A cache is read whole, and saved through a temporary file of its own
+# that replaces the old file, so readers never see a partial file and
+# concurrent savers don't share a temporary name. Windows can't rename
+# over an existing file, so there it is removed first. Saves within a
+# process are serialized.
+
+_save_lock = threading.Lock()
+
+def load_json(file_name):
+    if not os.path.exists(file_name):
+        return {}
+    try:
+        with open(file_name) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        # A damaged cache is rebuilt
+        return {}
+
+def save_json(file_name, entries):
+
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)),
+                                     prefix='.' + os.path.basename(file_name))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        with _save_lock:
+            if sys.platform == 'win32' and os.path.exists(file_name):
+                os.remove(file_name)
+            os.rename(temp_name, file_name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+#----
+#
+# Assemble a 32-bit word from eight 4-bit reads, first read is the LSBs
+
+def nibble_word(nibbles):
+    word = 0
+    for i, nibble in enumerate(nibbles):
+        word |= nibble << (4 * i)
+    return word
+
+#------------------------------------------------------------------------------
+
+class NodeInfo(object):
+
+    def __init__(self, address, version, node_id, manufacturer, instance):
+
+        self.address      = address
+        self.version      = version
+        self.node_id      = node_id
+        self.manufacturer = manufacturer
+        self.instance     = instance
+
+    #----
+
+    @classmethod
+    def from_word(cls, address, word):
+        return cls(address,
+                   word >> 27,
+                   (word >> 19) & 0xFF,
+                   (word >> 8) & 0x7FF,
+                   word & 0xFF)
+
+    #----
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    #----
+
+    def __repr__(self):
+        return ('NodeInfo(address=%d, id=%d, instance=%d, manufacturer=0x%03X, '
+                'version=%d)' % (self.address, self.node_id, self.instance,
+                                 self.manufacturer, self.version))
+
+#------------------------------------------------------------------------------
+
+class HubInfo(object):
+
+    def __init__(self, version, node_count, manufacturer, m_width, nodes=()):
+
+        self.version      = version
+        self.node_count   = node_count
+        self.manufacturer = manufacturer
+        self.m_width      = m_width
+        self.nodes        = list(nodes)
+
+    #----
+    #
+    # Width of the node address field of the virtual IR. Address 0 is the
+    # hub itself, nodes are 1 to node_count.
+
+    @property
+    def n_width(self):
+        return self.node_count.bit_length()
+
+    #----
+
+    @classmethod
+    def from_word(cls, word):
+        return cls(word >> 27,
+                   (word >> 19) & 0xFF,
+                   (word >> 8) & 0x7FF,
+                   word & 0xFF)
+
+    #----
+    #
+    # False if the HUB_INFO read isn't from an Altera SLD hub, e.g. the
+    # device isn't configured
+
+    def valid(self):
+        return self.manufacturer == ALTERA_MANUFACTURER
+
+    #----
+    #
+    # Returns the first node matching the given ID and/or instance
+
+    def find(self, node_id=None, instance=None):
+        for node in self.nodes:
+            if node_id is not None and node.node_id != node_id:
+                continue
+            if instance is not None and node.instance != instance:
+                continue
+            return node
+        return None
+
+    #----
+
+    def to_dict(self):
+        return {'version': self.version,
+                'node_count': self.node_count,
+                'manufacturer': self.manufacturer,
+                'm_width': self.m_width,
+                'nodes': [node.to_dict() for node in self.nodes]}
+
+    #----
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['version'], d['node_count'], d['manufacturer'],
+                   d['m_width'], [NodeInfo(**node) for node in d['nodes']])
+
+    #----
+
+    def __repr__(self):
+        return ('HubInfo(nodes=%d, m=%d, n=%d, manufacturer=0x%03X, version=%d)'
+                % (self.node_count, self.m_width, self.n_width,
+                   self.manufacturer, self.version))
+
+#------------------------------------------------------------------------------
+#
+# Topology cache
+#
+# Discovered HubInfo, stored as JSON keyed by device and design, so later
+# sessions on the same board and design can skip enumeration. Changes are
+# made to the file's current entries, so processes sharing it keep each
+# other's.
+
+class TopologyCache(object):
+
+    def __init__(self, file_name=DEFAULT_TOPOLOGY_FILE):
+        self.file_name = file_name
+        self.entries   = load_json(file_name)
+
+    #----
+
+    @staticmethod
+    def key(device, design):
+        return '%s/%s' % (device, design)
+
+    #----
+
+    def get(self, device, design):
+        d = self.entries.get(self.key(device, design))
+        if d is None:
+            return None
+        return HubInfo.from_dict(d)
+
+    #----
+
+    def put(self, device, design, hub):
+        self.entries = load_json(self.file_name)
+        self.entries[self.key(device, design)] = hub.to_dict()
+        self.save()
+
+    #----
+
+    def forget(self, device, design):
+        self.entries = load_json(self.file_name)
+        if self.entries.pop(self.key(device, design), None) is not None:
+            self.save()
+
+    #----
+
+    def save(self):
+        save_json(self.file_name, self.entries)
+
@@ -0,0 +1,1095 @@
+#------------------------------------------------------------------------------
+#
+#   sld_interface.py
+#
+#   A Python interface to SLD Controller & nodes via USB-Blaster
+#
+#   Version 0.0.1  -  4/25/14
+#
+#------------------------------------------------------------------------------
+
+import ctypes as c
+from binascii import hexlify, unhexlify
+from time import sleep, time
+
+from .ftdi import *
+from .bits import BitVector, to_bits
+from .sld_tuning import DEFAULT_PROFILE
+from .sld_stats import SLDStats, instrument, uninstrument
+from .sld_hub import (HubInfo, NodeInfo, TopologyCache, nibble_word,
+                     NIBBLES_PER_WORD, VIR_CLEAR_BITS, DEFAULT_TOPOLOGY_FILE)
+
+
+#------------------------------------------------------------------------------
+#
+# Create a write buffer as a ctypes array of bytes
+
+def tx_buffer(byte_list):
+    return (c.c_ubyte * len(byte_list))(*byte_list)
+
+#-------------------------------------------------------------------------------
+#
+# FT245 Bit definitions for JTAG mode
+
+OFF = 0x00
+TCK = 0x01
+TMS = 0x02
+TDI = 0x10
+LED = 0x20
+RD  = 0x40
+sHM = 0x80
+
+# Bit-mode - Two byte codes
+M0D0R = [LED             | RD , LED             | TCK]
+M0D1R = [LED | TDI       | RD , LED       | TDI | TCK]
+M1D0R = [LED | TMS       | RD , LED | TMS | TCK]
+M1D1R = [LED | TMS | TDI | RD , LED | TMS | TDI | TCK]
+
+M0D0 = [LED                   , LED             | TCK]
+M0D1 = [LED | TDI             , LED       | TDI | TCK]
+M1D0 = [LED | TMS             , LED | TMS       | TCK]
+M1D1 = [LED | TMS | TDI       , LED | TMS | TDI | TCK]
+
+# TAP controller Reset
+TAP_RESET = tx_buffer(M1D0 + M1D0 + M1D0 + M1D0 + M1D0)
+
+# TAP controller Reset to Idle
+TAP_IDLE = tx_buffer(M0D0)
+
+# TAP controller Idle to Shift_DR 
+TAP_SHIFT_DR = tx_buffer(M1D0 + M0D0 + M0D0)
+
+# TAP controller Idle to Shift_IR 
+TAP_SHIFT_IR = tx_buffer(M1D0 + M1D0 + M0D0 + M0D0)
+
+# TAP controller Exit1 to Idle 
+TAP_END_SHIFT = tx_buffer(M1D0 + M0D0)
+
+# IR values
+
+USER0 = BitVector(0b0000001100, 10)
+USER1 = BitVector(0b0000001110, 10)
+
+SELECT_VIR = tx_buffer(M0D0 + M0D1 + M0D1 + M0D1 + M0D0 +
+                       M0D0 + M0D0 + M0D0 + M0D0 + M1D0)
+
+SELECT_VDR = tx_buffer(M0D0 + M0D0 + M0D1 + M0D1 + M0D0 +
+                       M0D0 + M0D0 + M0D0 + M0D0 + M1D0)
+
+NODE_SHIFT_INST  = tx_buffer(M0D1 + M0D0 + M0D0 + M0D0 + M1D1)
+
+NODE_UPDATE_INST = tx_buffer(M0D0 + M0D0 + M0D0 + M0D0 + M1D1)
+
+# Node Data 
+NODE_DATA = tx_buffer(M0D0 + M0D1 + M0D1 + M0D0 + M0D0 + M0D1 + M1D1)
+
+#------------------------------------------------------------------------------
+#
+# TDO decoding
+#
+# The FT245 returns n_bytes of byte-mode data, each holding 8 TDO bits LSB
+# first, followed by n_bits bytes of bit-mode data with TDO in bit 0. The
+# first bit read is the LSB of the result. NumPy is used when available
+# for reads of NUMPY_MIN_BITS or more, below that it costs more than it
+# saves.
+
+NUMPY_MIN_BITS = 64
+
+# NumPy is imported by the first read that can use it. None until then,
+# False if it isn't installed.
+np = None
+
+def load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            np = False
+    return np
+
+# Translates a bit-mode byte to '0' or '1'
+TDO_CHARS = ''.join('1' if i & 1 else '0' for i in range(256))
+
+#----
+#
+# NumPy: the TDO bits MSB first, packed into bytes
+
+def tdo_packed(byte_list, n_bytes, n_bits):
+    raw = np.frombuffer(byte_list, dtype=np.uint8, count=n_bytes + n_bits)
+    
+    # MSB first: bit-mode bits in reverse, then byte-mode bytes in reverse
+    msb_first = raw[n_bytes:][::-1] & 1
+    if n_bytes:
+        msb_first = np.concatenate((msb_first,
+                                    np.unpackbits(raw[n_bytes - 1::-1])))
+    return np.packbits(msb_first).tobytes()
+
+#----
+
+def tdo_bits(byte_list, n_bytes, n_bits):
+
+    # bitstring is only loaded when BitArray results are asked for
+    from bitstring import BitArray
+
+    size = 8 * n_bytes + n_bits
+
+    if size >= NUMPY_MIN_BITS and load_numpy():
+        return BitArray(bytes=tdo_packed(byte_list, n_bytes, n_bits), length=size)
+
+    bits = BitArray(bin=byte_list[n_bytes:n_bytes + n_bits][::-1].translate(TDO_CHARS))
+    if n_bytes:
+        bits.append(BitArray(uint=int(hexlify(byte_list[n_bytes - 1::-1]), 16),
+                             length=8 * n_bytes))
+    return bits
+
+#----
+#
+# The TDO bits as an int, for BitVector results. Byte-mode data converts
+# through hexlify faster than NumPy can unpack it, and int() parses the
+# bit-mode TDO string faster than NumPy packs it, below NUMPY_VALUE_BITS.
+
+NUMPY_VALUE_BITS = 4096
+
+def tdo_value(byte_list, n_bytes, n_bits):
+
+    if n_bits >= NUMPY_VALUE_BITS and load_numpy():
+        packed = tdo_packed(byte_list[n_bytes:n_bytes + n_bits], 0, n_bits)
+        value = int(hexlify(packed), 16) >> (8 * len(packed) - n_bits)
+    else:
+        bit_chars = byte_list[n_bytes:n_bytes + n_bits][::-1].translate(TDO_CHARS)
+        value = int(bit_chars or '0', 2)
+
+    if n_bytes:
+        value <<= 8 * n_bytes
+        value |= int(hexlify(byte_list[n_bytes - 1::-1]), 16)
+    return value
+
+#----
+#
+# Convert bytes read from the FT245 in bit-mode to a BitArray
+
+def rx_bits(byte_list, size=None):
+    if size is None:
+        size = len(byte_list)
+    return tdo_bits(byte_list, 0, size)
+       
+#------------------------------------------------------------------------------
+#
+# Decode a list of FT245 command bytes
+
+def decoded(cmd):
+    i = 0
+    result = []
+    while True:
+        b2 = [cmd[i], cmd[i+1]]
+        if   b2 == M0D0R:
+            result.append('M0D0R')
+        elif b2 == M0D1R:
+            result.append('M0D1R')
+        elif b2 == M1D0R:
+            result.append('M1D0R')
+        elif b2 == M1D1R:
+            result.append('M1D1R')
+
+        elif b2 == M0D0:
+            result.append('M0D0')
+        elif b2 == M0D1:
+            result.append('M0D1')
+        elif b2 == M1D0:
+            result.append('M1D0')
+        elif b2 == M1D1:
+            result.append('M1D1')
+            
+        i += 2
+        if i == len(cmd):
+            break
+            
+    return ','.join(result)
+       
+#------------------------------------------------------------------------------
+#
+# Generate CSV output - For testing with 245_decode.py
+# This class can be substituted for ftdi.FTD2XX class
+
+class CSV_Writer(object):
+    
+    def __init__(self,file_name):
+        
+        self.cvs = open(file_name, 'w')
+        self.step = 1
+        self.fn = file_name
+        
+        self.status_count = 1
+    
+    #----
+
+    def reset_device(self):
+        pass
+    
+    #----
+
+    def write(self, buff):
+        
+        # buff is a ctypes array of bytes
+               
+        for i in range(c.sizeof(buff)):
+            bits = reversed(list('000000' + bin(buff[i])[2:]) + [str(self.step)])
+            print >>self.cvs, ','.join(bits)
+            
+            self.step +=  1
+            
+    #----
+
+    def write_from(self, data, offset=0, size=None):
+        if size is None:
+            size = len(data) - offset
+        self.write((c.c_ubyte * size).from_buffer(data, offset))
+        return size
+            
+    #----
+    #
+    # This is a kluge, but it works with VDR_Write_Read()
+    
+    def get_queue_status(self):
+        c = self.status_count
+        self.status_count += 1
+        return c
+            
+    #----
+    #
+    # read returns all zeros
+    
+    def read(self, count, raw=True):
+        result = '\x00' * count
+        self.status_count = 1
+        return result
+    
+    def read_into(self, buff, offset=0, size=None):
+        if size is None:
+            size = len(buff) - offset
+        buff[offset:offset + size] = self.read(size)
+        return size
+    
+    #----
+    
+    def close(self):
+        self.cvs.close()
+        print '%s closed' % self.fn
+
+#-------------------------------------------------------------------------------
+#
+# Encoding tables
+#
+# BIT_TABLE[b] is the bit-mode command string that shifts the 8 bits of
+# data byte b, LSB first. READ_TABLE[b] does the same, reading back TDO.
+# The pair tuples are indexed by a single bit value.
+
+def command_string(byte_list):
+    return str(bytearray(byte_list))
+
+def bit_table(zero, one):
+    return [command_string(sum([one if (b >> i) & 1 else zero
+                                for i in range(8)], []))
+            for b in range(256)]
+
+BIT_TABLE  = bit_table(M0D0, M0D1)
+READ_TABLE = bit_table(M0D0R, M0D1R)
+
+BIT_PAIRS       = (command_string(M0D0),  command_string(M0D1))
+READ_PAIRS      = (command_string(M0D0R), command_string(M0D1R))
+LAST_BIT_PAIRS  = (command_string(M1D0),  command_string(M1D1))
+LAST_READ_PAIRS = (command_string(M1D0R), command_string(M1D1R))
+
+#----
+#
+# The n_bytes low bytes of value as a string, least significant byte first
+
+def lsb_bytes(value, n_bytes):
+    if not n_bytes:
+        return ''
+    mask = (1 << (8 * n_bytes)) - 1
+    return unhexlify('%0*x' % (2 * n_bytes, value & mask))[::-1]
+
+#----
+#
+# Bit-mode command bytes for the bits of value above the whole bytes
+
+def tail_bits(value, start, size, rd):
+
+    if rd:
+        pairs, last = READ_PAIRS, LAST_READ_PAIRS
+    else:
+        pairs, last = BIT_PAIRS, LAST_BIT_PAIRS
+
+    # All but the MSB
+    result = [pairs[(value >> i) & 1] for i in range(start, size - 1)]
+
+    # Process MSB
+    result.append(last[(value >> (size - 1)) & 1])
+    return result
+
+#-------------------------------------------------------------------------------
+#
+# Create a string of FT245 command bytes from a BitArray (bits) instance.
+# bits is not modified.
+
+def dataBuffer(bits, rd=False):
+
+    size = len(bits)
+    value = bits.uint
+    n_bytes = (size - 1) // 8
+
+    table = READ_TABLE if rd else BIT_TABLE
+    data_bytes = [table[b] for b in bytearray(lsb_bytes(value, n_bytes))]
+    data_bytes += tail_bits(value, 8 * n_bytes, size, rd)
+
+#     print 'dataBuffer %s' % decoded(bytearray(''.join(data_bytes)))
+
+    return ''.join(data_bytes)
+
+#-------------------------------------------------------------------------------
+#
+# Byte-shift mode
+#
+# A header byte with sHM set is followed by up to 63 data bytes. Each data
+# byte is shifted out on TDI LSB first with TMS = 0, so a byte costs one
+# USB byte instead of the sixteen needed in bit-mode. If RD is also set in
+# the header, one byte of TDO data (LSB first) is returned per data byte.
+#
+# The final bit must be clocked with TMS = 1, so it is always sent in
+# bit-mode, along with any bits left over that don't fill a whole byte.
+
+MAX_SHIFT_BYTES = 63
+
+# Leaves TCK low before the CPLD shifter takes over
+TCK_LOW = chr(LED)
+
+def byte_split(size):
+    # Returns (bytes shifted in byte-mode, bits shifted in bit-mode)
+    n_bytes = (size - 1) // 8
+    return n_bytes, size - 8 * n_bytes
+
+#----
+
+def read_count(size, byte_mode=True):
+    # Number of bytes the FT245 returns for a read of size bits
+    if byte_mode:
+        return sum(byte_split(size))
+    return size
+
+#----
+#
+# Create a string of FT245 command bytes from a BitArray (bits) instance,
+# using byte-shift mode for all whole bytes below the MSB
+
+def byteBuffer(bits, rd=False):
+
+    size = len(bits)
+    value = bits.uint
+    n_bytes, n_bits = byte_split(size)
+    data_bytes = []
+
+    if n_bytes:
+        data_bytes.append(TCK_LOW)
+
+        # Data bytes in shift order, LSB first
+        shift_bytes = lsb_bytes(value, n_bytes)
+
+        header = sHM | RD if rd else sHM
+        for i in range(0, n_bytes, MAX_SHIFT_BYTES):
+            chunk = shift_bytes[i:i + MAX_SHIFT_BYTES]
+            data_bytes.append(chr(header | len(chunk)))
+            data_bytes.append(chunk)
+
+    data_bytes += tail_bits(value, 8 * n_bytes, size, rd)
+    return ''.join(data_bytes)
+
+#----
+#
+# Convert the bytes read from the FT245 after a byteBuffer() read of size bits
+# to a BitArray
+
+def rx_byte_bits(byte_list, size):
+    return tdo_bits(byte_list, *byte_split(size))
+
+#-------------------------------------------------------------------------------
+#
+# Command queue
+#
+# Collects the FT245 command bytes of one or more SLD operations in a
+# preallocated buffer so they go to the driver in a single FT_Write.
+# Writes are sent when the buffer fills, on flush(), or by commit() at the
+# end of each SLD operation. Inside a "with queue:" block commit() does
+# nothing, so everything is sent in one transfer when the block exits.
+
+# Largest single transfer handed to the d2xx driver
+MAX_TRANSFER_SIZE = 65536
+
+class CommandQueue(object):
+
+    def __init__(self, interface, size=MAX_TRANSFER_SIZE):
+
+        self.interface = interface
+        self.size      = size
+        self.buffer    = bytearray(size)
+        self.count     = 0
+        self.hold      = 0
+
+    #----
+    #
+    # Append a ctypes array, str or bytearray of command bytes
+
+    def write(self, buff):
+
+        data = buffer(buff)
+        start = 0
+        while start < len(data):
+            n = min(len(data) - start, self.size - self.count)
+            self.buffer[self.count:self.count + n] = data[start:start + n]
+            self.count += n
+            start += n
+            if self.count == self.size:
+                self.flush()
+
+    #----
+    #
+    # End of an SLD operation
+
+    def commit(self):
+        if not self.hold:
+            self.flush()
+
+    #----
+    #
+    # Send everything queued so far
+
+    def flush(self):
+
+        if self.count:
+            self.interface.write_from(self.buffer, 0, self.count)
+            self.count = 0
+
+    #----
+    #
+    # Change the transfer size, sending anything queued first
+
+    def resize(self, size):
+        self.flush()
+        self.size   = size
+        self.buffer = bytearray(size)
+
+    #----
+
+    def __enter__(self):
+        self.hold += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hold -= 1
+        if not self.hold:
+            self.flush()
+        return False
+
+#-------------------------------------------------------------------------------
+#
+# Raised when read data doesn't arrive in time
+
+class SLDTimeoutError(Exception):
+    
+    def __init__(self, expected, received):
+        self.expected = expected
+        self.received = received
+
+    def __str__(self):
+        return 'read timed out, %d of %d bytes received' % (self.received,
+                                                             self.expected)
+
+#-------------------------------------------------------------------------------
+#
+# A class for higher level SLD functions
+#
+# instruction/data arguments are BitArray or BitVector instances. Data
+# can also be bytes, or an int with a size, and instructions can be ints.
+# Reads return a BitArray if the data was one, otherwise a BitVector.
+#
+# All start and end in the Run_Test/Idle TAP state
+#
+# If m_width and n_width are None they are found by enumerating the SLD
+# hub, or from the topology cache if this device and the named design have
+# been seen before. Pass topology_file=None to always enumerate.
+
+class SLD_Controller(object):
+    
+    def __init__(self, interface_name, m_width, n_width, csv_file_name = '',
+                 byte_mode=True, cache_ir=True, read_timeout=1.0,
+                 serial_number=None, design=None,
+                 topology_file=DEFAULT_TOPOLOGY_FILE, profile=DEFAULT_PROFILE,
+                 device=None, stats=None):
+        
+        # With several identical adapters, open one by its serial number.
+        # 'SIM' opens a simulated USB-Blaster and InitialTest design, 'CSV'
+        # and 'TRACE' record the commands to csv_file_name, as CSV or a
+        # binary trace, and device can be any object with the FTD2XX
+        # interface.
+        if device is not None:
+            self.interface = device
+        elif interface_name == 'CSV':
+            self.interface = CSV_Writer(csv_file_name)
+        elif interface_name == 'TRACE':
+            from .ft245_trace import TraceWriter
+            self.interface = TraceWriter(csv_file_name)
+        elif interface_name == 'SIM':
+            from .sld_sim import SimulatedBlaster
+            self.interface = SimulatedBlaster()
+        elif serial_number is not None:
+            self.interface = open_ex(serial_number)
+        else:        
+            self.interface = open_ex_by_name(interface_name)
+        
+        # The adapter's serial number keys the fingerprint cache, None if
+        # the interface doesn't have one
+        if serial_number is None and hasattr(self.interface, 'get_device_info'):
+            try:
+                serial_number = self.interface.get_device_info()['SerialNumber']
+            except FTDeviceError:
+                pass
+        
+        self.interface_name = interface_name
+        self.serial_number  = serial_number or None
+        
+        self.instruction_width  = 10
+        self.virtual_inst_width = m_width
+        self.node_adrs_width    = n_width
+        self.hub                = None
+        
+        # Use byte-shift mode for data longer than 8 bits
+        self.byte_mode = byte_mode
+        
+        # All writes go through the command queue
+        self.queue = CommandQueue(self.interface)
+        
+        # USB latency timer and transfer sizes, None keeps driver defaults
+        self.profile = None
+        if profile is not None:
+            self.apply_profile(profile)
+        
+        # Skip IR and virtual IR loads that wouldn't change anything.
+        # Set cache_ir False to always load them.
+        self.cache_ir = cache_ir
+        self.invalidate()
+        
+        # Encoded IR and VIR loads, keyed by instruction
+        self.ir_loads  = {}
+        self.vir_loads = {}
+        
+        # Reads wait up to read_timeout seconds, on the driver's receive
+        # event where there is one, otherwise polling with a growing delay
+        self.read_timeout = read_timeout
+        self.min_backoff  = 0.0001
+        self.max_backoff  = 0.01
+        self.rx_buffer    = bytearray(MAX_TRANSFER_SIZE)
+        if hasattr(self.interface, 'rx_event'):
+            self.rx_event = self.interface.rx_event()
+        else:
+            self.rx_event = None
+        
+        self.interface.reset_device()
+        self.queue.write(TAP_RESET)
+        self.queue.write(TAP_IDLE)
+        self.queue.commit()
+        
+        # Counters and latency histograms, off unless stats is an SLDStats
+        # or True
+        self.stats = None
+        if stats:
+            self.enable_stats(None if stats is True else stats)
+        
+        if m_width is None or n_width is None:
+            self.discover(design, topology_file)
+        
+    #----
+
+    def shiftBuffer(self, bits, rd=False):
+        if self.byte_mode:
+            return byteBuffer(bits, rd)
+        return dataBuffer(bits, rd)
+        
+    #----
+
+    def flush(self):
+        self.queue.flush()
+        
+    #----
+    #
+    # Configure the USB transfer settings, and send writes in chunks of
+    # the profile's transfer size
+    
+    def apply_profile(self, profile):
+        self.queue.resize(profile.chunk_size())
+        profile.apply(self.interface)
+        self.profile = profile
+        
+    #----
+    #
+    # Start collecting statistics, in a new SLDStats unless one is given.
+    # Returns the SLDStats.
+    
+    def enable_stats(self, stats=None):
+        self.disable_stats()
+        if stats is None:
+            stats = SLDStats(self.serial_number or self.interface_name)
+        instrument(self, stats)
+        self.stats = stats
+        return stats
+        
+    #----
+    
+    def disable_stats(self):
+        uninstrument(self)
+        self.stats = None
+        
+    #----
+
+    def memoize(self, tap_path, instruction):
+        # TAP path, instruction shift and return to Idle as one string
+        return ''.join([buffer(tap_path)[:], self.shiftBuffer(instruction),
+                        buffer(TAP_END_SHIFT)[:]])
+        
+    #----
+
+    def TAP_Reset(self):
+        self.queue.write(TAP_RESET)
+        self.queue.write(TAP_IDLE)
+        self.queue.commit()
+        self.invalidate()
+        
+    #----
+    #
+    # Forget the cached IR and virtual IR values. Call this if something
+    # else may have changed the TAP state.
+    
+    def invalidate(self):
+        self.ir       = None
+        self.vir      = {}
+        self.vir_node = None
+        
+    #----
+    
+    def IR_Write(self, instruction):
+        self.load_ir(instruction)
+        self.queue.commit()
+            
+    #----
+    
+    def VIR_Write(self, node, instruction):
+        self.load_vir(node, instruction)
+        self.queue.commit()
+            
+    #----
+    #
+    # Returns a BitArray
+   
+    def VDR_Read(self, size):
+        return self.scan_read(self.load_vdr, BitVector(0, size), True)
+            
+    #----
+    
+    def VDR_Write(self, data, size=None):
+        self.load_vdr(to_bits(data, size))
+        self.queue.commit()
+            
+    #----
+    
+    def VDR_Write_Read(self, data, size=None):
+        bits = to_bits(data, size)
+        return self.scan_read(self.load_vdr, bits, not isinstance(bits, BitVector))
+            
+    #----
+    #
+    # DR scan with the instruction last written by IR_Write
+    
+    def DR_Write_Read(self, data, size=None):
+        bits = to_bits(data, size)
+        return self.scan_read(self.load_dr, bits, not isinstance(bits, BitVector))
+            
+    #----
+    #
+    # Queue a scan with load(bits, True), send it and decode its read data
+    
+    def scan_read(self, load, bits, bitarray):
+        count = load(bits, True)
+        self.queue.flush()
+        return self.rx_decode(self.read_bytes(count), len(bits), bitarray)
+            
+    #----
+    #
+    # Open a ScanSession to queue many operations in one USB stream
+    
+    def session(self):
+        return ScanSession(self)
+
+    #----
+    #
+    # Start a ScanTemplate, for operations repeated with new data
+
+    def template(self):
+        from .sld_template import ScanTemplate
+        return ScanTemplate(self)
+            
+    #----
+    #
+    # Queue the command bytes for an operation without sending them
+    
+    def load_ir(self, instruction):
+        
+        if isinstance(instruction, (int, long)):
+            instruction = BitVector(instruction, self.instruction_width)
+        
+        if self.cache_ir and instruction.bin == self.ir:
+            return
+        
+        key = instruction.bin
+        if key not in self.ir_loads:
+            self.ir_loads[key] = self.memoize(TAP_SHIFT_IR, instruction)
+        
+        self.queue.write(self.ir_loads[key])
+        self.ir = key
+            
+    #----
+    
+    def load_vir(self, node, instruction):
+        
+        if isinstance(instruction, (int, long)):
+            instruction = BitVector(instruction, self.virtual_inst_width)
+        
+        # The node's virtual IR is unchanged, and it is the selected node
+        if (self.cache_ir and node == self.vir_node and
+            self.vir.get(node) == instruction.bin):
+            return
+        
+        #  load the JTAG IR with USER1 to select the Virtual IR
+        self.load_ir(USER1)
+        
+        # Load the virtual IR with the node address and instruction
+        key = instruction.bin
+        if (node, key) not in self.vir_loads:
+            self.vir_loads[node, key] = self.memoize(TAP_SHIFT_DR,
+                                                     self.vir_value(node, instruction))
+        
+        self.queue.write(self.vir_loads[node, key])
+        self.vir[node] = key
+        self.vir_node  = node
+            
+    #----
+    #
+    # The virtual IR value: node address in the top n bits, instruction
+    # (zero extended to m bits) below it
+    
+    def vir_value(self, node, instruction):
+        
+        m = self.virtual_inst_width
+        n = self.node_adrs_width
+        if len(instruction) > m:
+            raise ValueError('instruction is %d bits, the virtual IR is %d'
+                             % (len(instruction), m))
+        if node >= (1 << n):
+            raise ValueError('node %d needs more than %d address bits' % (node, n))
+        
+        value = instruction.uint if len(instruction) else 0
+        return BitVector((node << m) | value, n + m)
+            
+    #----
+    #
+    # Returns the number of bytes the FT245 will return, 0 if rd is False
+    
+    def load_vdr(self, data, rd=False):
+
+        #  load the JTAG IR with USER0 to select the Virtual DR
+        self.load_ir(USER0)
+        
+        # Load the selected node's virtual DR with data
+        return self.load_dr(data, rd)
+            
+    #----
+    #
+    # DR scan with whatever instruction is in the JTAG IR
+    
+    def load_dr(self, data, rd=False):
+        
+        self.queue.write(TAP_SHIFT_DR)
+        self.queue.write(self.shiftBuffer(data, rd))
+        self.queue.write(TAP_END_SHIFT)
+        
+        if rd:
+            return read_count(len(data), self.byte_mode)
+        return 0
+            
+    #----
+    #
+    # Configure the FPGA from a .sof or .rbf file, unless it is already
+    # configured with it. options are fingerprint_file and force, see
+    # sld_config.py. Returns True if the FPGA was configured.
+
+    def configure(self, file_name, **options):
+        from .sld_config import configure
+        return configure(self, file_name, **options)
+
+    #----
+    #
+    # Find the hub's node count and virtual IR width, and each node's
+    # information. Uses the topology cache when this device and design
+    # have been enumerated before. Without a design name the FPGA could
+    # hold anything, so the cache isn't used. Returns a HubInfo.
+    
+    def discover(self, design=None, topology_file=DEFAULT_TOPOLOGY_FILE,
+                 refresh=False):
+        
+        device = self.serial_number or self.interface_name
+        cache = None
+        if topology_file and design is not None:
+            cache = TopologyCache(topology_file)
+        
+        hub = None
+        if cache is not None and not refresh:
+            hub = cache.get(device, design)
+        
+        if hub is None:
+            hub = self.enumerate_hub()
+            if cache is not None and hub.valid():
+                cache.put(device, design, hub)
+        
+        self.hub = hub
+        self.virtual_inst_width = hub.m_width
+        self.node_adrs_width    = hub.n_width
+        
+        # VIR loads and cached VIR values are for the old widths
+        self.vir_loads = {}
+        self.invalidate()
+        return hub
+            
+    #----
+    #
+    # Read HUB_INFO and each node's NODE_INFO over JTAG
+    
+    def enumerate_hub(self):
+        
+        # Select the hub (address 0) with the HUB_INFO instruction. The
+        # width isn't known yet, so shift enough zeros to fill any VIR.
+        with self.session() as s:
+            self.load_ir(USER1)
+            self.load_dr(BitVector(0, VIR_CLEAR_BITS))
+            nibbles = [s.VDR_Read(4) for i in range(NIBBLES_PER_WORD)]
+        
+        hub = HubInfo.from_word(nibble_word([n.result().uint for n in nibbles]))
+        
+        with self.session() as s:
+            nibbles = [s.VDR_Read(4)
+                       for i in range(NIBBLES_PER_WORD * hub.node_count)]
+        
+        for address in range(1, hub.node_count + 1):
+            i = (address - 1) * NIBBLES_PER_WORD
+            word = nibble_word([n.result().uint
+                                for n in nibbles[i:i + NIBBLES_PER_WORD]])
+            hub.nodes.append(NodeInfo.from_word(address, word))
+        
+        # The hub's VIR is no longer known
+        self.invalidate()
+        return hub
+            
+    #----
+    #
+    # Read count bytes into rx_buffer. Returns a buffer that is valid
+    # until the next read. Raises SLDTimeoutError if the data doesn't
+    # arrive within timeout seconds (default read_timeout), after
+    # discarding what was received so late bytes can't misalign later
+    # reads.
+    
+    def read_bytes(self, count, timeout=None):
+        
+        if timeout is None:
+            timeout = self.read_timeout
+        deadline = time() + timeout
+        
+        if len(self.rx_buffer) < count:
+            self.rx_buffer = bytearray(count)
+        
+        received = 0
+        backoff = self.min_backoff
+        while received < count:
+            
+            available = self.interface.get_queue_status()
+            if available:
+                n = min(available, count - received)
+                received += self.interface.read_into(self.rx_buffer, received, n)
+                backoff = self.min_backoff
+                continue
+            
+            remaining = deadline - time()
+            if remaining <= 0:
+                self.discard_rx()
+                raise SLDTimeoutError(count, received)
+            
+            if self.rx_event is not None:
+                self.rx_event.wait(remaining)
+            else:
+                sleep(min(backoff, remaining))
+                backoff = min(2 * backoff, self.max_backoff)
+        
+        return buffer(self.rx_buffer, 0, count)
+            
+    #----
+    #
+    # Empty the RX queue, with FT_Purge where the interface has it
+
+    def discard_rx(self):
+        if hasattr(self.interface, 'purge'):
+            self.interface.purge('RX')
+            return
+        available = self.interface.get_queue_status()
+        if available:
+            self.interface.read(available)
+            
+    #----
+    #
+    # Convert read data for a shift of size bits to a BitArray, or a
+    # BitVector if bitarray is False
+    
+    def rx_decode(self, rx_data, size, bitarray=True):
+        split = byte_split(size) if self.byte_mode else (0, size)
+        if bitarray:
+            return tdo_bits(rx_data, *split)
+        return BitVector(tdo_value(rx_data, *split), size)
+            
+    #----
+    
+    def close(self):
+        self.queue.flush()
+        if self.rx_event is not None:
+            self.rx_event.close()
+        self.interface.close()
+
+#-------------------------------------------------------------------------------
+#
+# Pipelined scans
+#
+# A ScanSession queues SLD operations without waiting for read data. Each
+# read returns a ScanResult handle, and run() sends everything as one
+# USB stream, reads all the TDO data back and hands each handle its bits.
+# Leaving a "with sld.session() as s:" block calls run().
+#
+# Don't call the SLD_Controller read methods while a session has reads
+# outstanding, their data would arrive behind the session's.
+
+class ScanResult(object):
+    
+    def __init__(self, session, size, bitarray=True):
+        
+        self.session  = session
+        self.size     = size
+        self.bitarray = bitarray
+        self.value    = None
+        
+    #----
+    
+    def done(self):
+        return self.value is not None
+        
+    #----
+    #
+    # Returns the read data, running the session if needed
+    
+    def result(self):
+        if self.value is None:
+            self.session.run()
+        return self.value
+        
+#----
+
+class ScanSession(object):
+    
+    def __init__(self, sld):
+        
+        self.sld   = sld
+        self.reads = []
+        
+    #----
+        
+    def TAP_Reset(self):
+        self.sld.TAP_Reset()
+        
+    #----
+        
+    def IR_Write(self, instruction):
+        self.sld.load_ir(instruction)
+        
+    #----
+        
+    def VIR_Write(self, node, instruction):
+        self.sld.load_vir(node, instruction)
+        
+    #----
+        
+    def VDR_Write(self, data, size=None):
+        self.sld.load_vdr(to_bits(data, size))
+        
+    #----
+        
+    def VDR_Read(self, size):
+        return self.queue_read(BitVector(0, size), True)
+        
+    #----
+        
+    def VDR_Write_Read(self, data, size=None):
+        bits = to_bits(data, size)
+        return self.queue_read(bits, not isinstance(bits, BitVector))
+        
+    #----
+        
+    def DR_Write_Read(self, data, size=None):
+        bits = to_bits(data, size)
+        return self.queue_read(bits, not isinstance(bits, BitVector),
+                               self.sld.load_dr)
+        
+    #----
+        
+    def queue_read(self, bits, bitarray, load=None):
+        if load is None:
+            load = self.sld.load_vdr
+        count = load(bits, True)
+        handle = ScanResult(self, len(bits), bitarray)
+        self.reads.append((handle, count))
+        return handle
+        
+    #----
+    #
+    # Send the queued operations and fill in the ScanResult handles
+        
+    def run(self):
+        
+        reads, self.reads = self.reads, []
+        self.sld.queue.flush()
+        
+        total = sum(count for handle, count in reads)
+        if not total:
+            return
+        
+        rx_data = self.sld.read_bytes(total)
+        
+        offset = 0
+        for handle, count in reads:
+            handle.value = self.sld.rx_decode(rx_data[offset:offset + count],
+                                              handle.size, handle.bitarray)
+            offset += count
+            
+    #----
+    
+    def __enter__(self):
+        self.sld.queue.__enter__()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sld.queue.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.run()
+        return False
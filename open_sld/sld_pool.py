@@ -0,0 +1,274 @@
+#------------------------------------------------------------------------------
+#
+#   sld_pool.py
+#
+#   Parallel access to several USB-Blasters
+#
+#------------------------------------------------------------------------------
+
+import threading
+import Queue
+from time import time
+
+from .ftdi import get_device_info_list
+from .sld_interface import SLD_Controller
+
+#------------------------------------------------------------------------------
+#
+# A scan job. fn(sld, *args) runs on the device's thread, result() waits
+# for it and returns its value, or raises its exception.
+
+class Job(object):
+
+    def __init__(self, fn, args):
+
+        self.fn    = fn
+        self.args  = args
+        self.value = None
+        self.error = None
+        self.event = threading.Event()
+
+    #----
+
+    def done(self):
+        return self.event.is_set()
+
+    #----
+
+    def result(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise RuntimeError('job not finished')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+#------------------------------------------------------------------------------
+#
+# One USB-Blaster, its SLD_Controller and the thread that owns it
+#
+# A device is marked unhealthy when it can't be opened, or after
+# max_failures jobs in a row fail, and the pool stops giving it work until
+# reopen() succeeds.
+
+class DeviceWorker(object):
+
+    def __init__(self, info, m_width, n_width, max_failures, kwargs):
+
+        self.serial      = info['SerialNumber']
+        self.location    = info['LocID']
+        self.description = info['Description']
+
+        self.m_width      = m_width
+        self.n_width      = n_width
+        self.kwargs       = kwargs
+        self.max_failures = max_failures
+
+        # Health
+        self.jobs_done            = 0
+        self.failures             = 0
+        self.consecutive_failures = 0
+        self.last_error           = None
+        self.busy_time            = 0.0
+        self.open_failed          = False
+
+        self.sld  = None
+        self.jobs = Queue.Queue()
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    #----
+
+    @property
+    def healthy(self):
+        return (not self.open_failed and
+                self.consecutive_failures < self.max_failures)
+
+    #----
+
+    def pending(self):
+        return self.jobs.qsize()
+
+    #----
+
+    def submit(self, fn, *args):
+        job = Job(fn, args)
+        self.jobs.put(job)
+        return job
+
+    #----
+    #
+    # Close and reopen the device, on its own thread
+
+    def reopen(self):
+        return self.submit(self.open_device)
+
+    #----
+
+    def open_device(self, sld=None):
+
+        if self.sld is not None:
+            try:
+                self.sld.close()
+            except Exception:
+                pass
+            self.sld = None
+
+        try:
+            self.sld = SLD_Controller('USB-Blaster', self.m_width, self.n_width,
+                                      serial_number=self.serial, **self.kwargs)
+        except Exception:
+            self.open_failed = True
+            raise
+        self.open_failed = False
+        self.consecutive_failures = 0
+
+    #----
+
+    def close(self):
+        job = self.submit(None)
+        self.thread.join()
+        return job
+
+    #----
+
+    def stats(self):
+        sld_stats = None
+        if self.sld is not None and self.sld.stats is not None:
+            sld_stats = self.sld.stats.to_dict()
+        return {'SerialNumber': self.serial,
+                'LocID': self.location,
+                'healthy': self.healthy,
+                'open_failed': self.open_failed,
+                'pending': self.pending(),
+                'jobs_done': self.jobs_done,
+                'failures': self.failures,
+                'consecutive_failures': self.consecutive_failures,
+                'last_error': self.last_error,
+                'busy_time': self.busy_time,
+                'sld_stats': sld_stats}
+
+    #----
+    #
+    # Device thread
+
+    def run(self):
+
+        try:
+            self.open_device()
+        except Exception as e:
+            self.record_failure(e)
+
+        while True:
+            job = self.jobs.get()
+
+            if job.fn is None:
+                if self.sld is not None:
+                    self.sld.close()
+                job.event.set()
+                break
+
+            start = time()
+            try:
+                if self.sld is None and job.fn != self.open_device:
+                    raise RuntimeError('device %s is not open' % self.serial)
+                job.value = job.fn(self.sld, *job.args)
+                self.jobs_done += 1
+                self.consecutive_failures = 0
+            except Exception as e:
+                job.error = e
+                self.record_failure(e)
+
+            self.busy_time += time() - start
+            job.event.set()
+
+    #----
+
+    def record_failure(self, error):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = repr(error)
+
+#------------------------------------------------------------------------------
+#
+# DevicePool
+#
+# Opens an SLD_Controller for every USB-Blaster found (or for the listed
+# serial numbers), each on its own thread. Jobs are functions called as
+# fn(sld, *args) on the device's thread; each returns a Job.
+
+class DevicePool(object):
+
+    def __init__(self, m_width, n_width, description='USB-Blaster',
+                 serials=None, max_failures=3, **kwargs):
+
+        if serials is None:
+            serials = [info['SerialNumber'] for info in blasters(description)]
+
+        info_by_serial = dict((info['SerialNumber'], info)
+                              for info in get_device_info_list())
+
+        self.workers = {}
+        for serial in serials:
+            info = info_by_serial.get(serial, {'SerialNumber': serial,
+                                               'LocID': None,
+                                               'Description': description})
+            self.workers[serial] = DeviceWorker(info, m_width, n_width,
+                                                max_failures, kwargs)
+
+    #----
+
+    def serials(self):
+        return sorted(self.workers)
+
+    #----
+    #
+    # Run a job on one device
+
+    def submit(self, serial, fn, *args):
+        return self.workers[serial].submit(fn, *args)
+
+    #----
+    #
+    # Run a job on the healthy device with the fewest jobs waiting
+
+    def dispatch(self, fn, *args):
+
+        healthy = [w for w in self.workers.values() if w.healthy]
+        if not healthy:
+            raise RuntimeError('no healthy devices')
+
+        worker = min(healthy, key=lambda w: w.pending())
+        return worker.submit(fn, *args)
+
+    #----
+    #
+    # Run a job on every healthy device. Returns a dict of Jobs by serial.
+
+    def map(self, fn, *args):
+        return dict((serial, worker.submit(fn, *args))
+                    for serial, worker in self.workers.items()
+                    if worker.healthy)
+
+    #----
+
+    def health(self):
+        return dict((serial, worker.stats())
+                    for serial, worker in self.workers.items())
+
+    #----
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.close()
+
+#------------------------------------------------------------------------------
+#
+# Device info for the attached adapters whose description starts with
+# description, in USB location order
+
+def blasters(description='USB-Blaster'):
+    found = [info for info in get_device_info_list()
+             if info['Description'].startswith(description)]
+    return sorted(found, key=lambda info: info['LocID'])
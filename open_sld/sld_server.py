@@ -0,0 +1,606 @@
+#------------------------------------------------------------------------------
+#
+#   sld_server.py
+#
+#   A local daemon that owns the USB-Blasters and serves many clients
+#
+#   Only one process can open a d2xx device. SLDServer opens each device
+#   once, as an AsyncSLDController, and accepts SLD operations from any
+#   number of local clients over a Unix socket. SLDClient has the
+#   SLD_Controller API and sends its operations to the server.
+#
+#   python -m open_sld.sld_server -m 4 -n 1 USB-Blaster
+#
+#       sld = SLDClient('USB-Blaster')
+#       sld.VIR_Write(1, 1)
+#       print sld.VDR_Write_Read(0x55, 7)
+#
+#   Protocol: one JSON object per line. A request is
+#
+#       {"id": 1, "device": "USB-Blaster", "ops": [["VIR_Write", 1, 1], ...]}
+#
+#   and its reply {"id": 1, "results": [...]} or {"id": 1, "error": "..."}.
+#   BitVector and BitArray values are {"bits": hex, "length": n} with
+#   "bitarray": true for a BitArray, bytes are {"bytes": hex}.
+#
+#   The operations of one request run together. Each round the server
+#   takes up to max_ops operations from every client with requests
+#   waiting, in turn, and runs them all in one ScanSession, so one USB
+#   stream serves them all. Each client's selected virtual IR and IR are
+#   restored before its operations run, so clients don't see each other's.
+#
+#------------------------------------------------------------------------------
+
+import json
+import os
+import socket
+from binascii import hexlify, unhexlify
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from .bits import BitVector
+from .sld_async import AsyncSLDController
+from .sld_interface import ScanResult
+
+DEFAULT_SOCKET = os.path.expanduser('~/.open_sld.sock')
+
+# Operations one client can run per round
+DEFAULT_MAX_OPS = 256
+
+# Operations a request can hold
+OPERATIONS = ('TAP_Reset', 'IR_Write', 'VIR_Write', 'VDR_Write', 'VDR_Read',
+              'VDR_Write_Read', 'DR_Write_Read')
+
+#------------------------------------------------------------------------------
+#
+# Wire values
+
+def encode_value(value):
+
+    if isinstance(value, BitVector):
+        return {'bits': '%x' % value.uint, 'length': len(value)}
+    if isinstance(value, str):
+        return {'bytes': hexlify(value)}
+    if hasattr(value, 'uint') or hasattr(value, 'bin'):
+        # A BitArray
+        n = len(value)
+        return {'bits': '%x' % (value.uint if n else 0), 'length': n,
+                'bitarray': True}
+    return value
+
+#----
+
+def decode_value(value):
+
+    if not isinstance(value, dict):
+        return value
+    if 'bytes' in value:
+        return unhexlify(value['bytes'])
+
+    bits = BitVector(int(value['bits'], 16), value['length'])
+    if value.get('bitarray'):
+        return bits.to_bitarray()
+    return bits
+
+#----
+
+def encode_message(message):
+    return json.dumps(message, separators=(',', ':')) + '\n'
+
+#------------------------------------------------------------------------------
+#
+# Server
+
+class SLDServerError(Exception):
+    pass
+
+#----
+#
+# What one client has selected on one device
+
+class ClientContext(object):
+
+    def __init__(self):
+        self.vir = None
+        self.ir  = None
+
+    #----
+    #
+    # Reload the client's virtual IR and IR, the controller's IR cache
+    # skips whatever is already loaded
+
+    def restore(self, sld):
+        if self.vir is not None:
+            sld.load_vir(*self.vir)
+        if self.ir is not None:
+            sld.load_ir(self.ir)
+
+    #----
+    #
+    # Follow what an operation selects
+
+    def update(self, method, args):
+        if method == 'VIR_Write':
+            self.vir = tuple(args)
+            self.ir  = None
+        elif method == 'IR_Write':
+            self.ir = args[0]
+        elif method == 'TAP_Reset':
+            self.vir = None
+            self.ir  = None
+        elif method != 'DR_Write_Read':
+            # Virtual DR scans load USER0
+            self.ir = None
+
+#----
+#
+# One round on the I/O thread. requests is a list of (ClientContext, ops).
+# Returns a list with the results of each request's ops, or the exception
+# it raised.
+
+def run_round(sld, requests):
+
+    replies = []
+    with sld.session() as s:
+        for context, ops in requests:
+            try:
+                context.restore(sld)
+                handles = []
+                for op in ops:
+                    method, args = op[0], [decode_value(a) for a in op[1:]]
+                    if method not in OPERATIONS:
+                        raise SLDServerError('unknown operation %s' % method)
+                    handles.append(getattr(s, method)(*args))
+                    context.update(method, args)
+                replies.append(handles)
+            except Exception as e:
+                replies.append(e)
+
+    return [reply if isinstance(reply, Exception) else
+            [h.result() if isinstance(h, ScanResult) else None for h in reply]
+            for reply in replies]
+
+#------------------------------------------------------------------------------
+#
+# A device and the requests waiting for it. Runs one round at a time.
+
+class DeviceChannel(object):
+
+    def __init__(self, name, controller, max_ops):
+
+        self.name       = name
+        self.controller = controller
+        self.max_ops    = max_ops
+
+        self.pending = {}
+        self.order   = deque()
+        self.busy    = False
+
+        # Totals
+        self.rounds   = 0
+        self.requests = 0
+
+    #----
+
+    def add(self, client, request):
+
+        if client not in self.pending:
+            self.pending[client] = deque()
+            self.order.append(client)
+        self.pending[client].append(request)
+        self.schedule()
+
+    #----
+
+    def drop(self, client):
+        if self.pending.pop(client, None) is not None:
+            self.order.remove(client)
+
+    #----
+    #
+    # Start a round if there is work and none is running
+
+    def schedule(self):
+
+        if self.busy or not self.pending:
+            return
+
+        taken = []
+        for client in list(self.order):
+            queue = self.pending[client]
+            ops = 0
+            while queue and (not ops or ops + len(queue[0]['ops']) <= self.max_ops):
+                request = queue.popleft()
+                ops += len(request['ops'])
+                taken.append((client, request))
+            if not queue:
+                del self.pending[client]
+                self.order.remove(client)
+
+        # The next round starts with the next client
+        self.order.rotate(-1)
+
+        work = [(client.context(self.name), request['ops'])
+                for client, request in taken]
+        future = self.controller.call(run_round, work)
+        future.add_done_callback(lambda f: self.finished(taken, f))
+        self.busy = True
+
+    #----
+
+    def finished(self, taken, future):
+
+        self.busy = False
+        self.rounds += 1
+        self.requests += len(taken)
+
+        error = future.exception()
+        replies = [error] * len(taken) if error is not None else future.result()
+        for (client, request), reply in zip(taken, replies):
+            client.reply(request, reply)
+
+        self.schedule()
+
+    #----
+
+    def close(self):
+        return self.controller.close()
+
+#------------------------------------------------------------------------------
+#
+# One client connection
+
+class ClientProtocol(asyncio.Protocol):
+
+    def __init__(self, server):
+        self.server    = server
+        self.transport = None
+        self.buffer    = ''
+        self.contexts  = {}
+
+    #----
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.server.drop(self)
+
+    #----
+
+    def data_received(self, data):
+
+        self.buffer += data
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            try:
+                request = json.loads(line)
+                valid = isinstance(request['ops'], list)
+            except (ValueError, KeyError, TypeError):
+                valid = False
+            if not valid:
+                self.send({'id': None, 'error': 'SLDServerError: bad request'})
+                continue
+            self.server.request(self, request)
+
+    #----
+
+    def context(self, device):
+        if device not in self.contexts:
+            self.contexts[device] = ClientContext()
+        return self.contexts[device]
+
+    #----
+
+    def reply(self, request, result):
+
+        if isinstance(result, Exception):
+            self.send({'id': request.get('id'),
+                       'error': '%s: %s' % (type(result).__name__, result)})
+        else:
+            self.send({'id': request.get('id'),
+                       'results': [encode_value(r) for r in result]})
+
+    def send(self, message):
+        if self.transport is not None:
+            self.transport.write(encode_message(message))
+
+#------------------------------------------------------------------------------
+#
+# The server
+#
+# add_device() opens a device by name. start() listens on the socket and
+# returns, serve_forever() also runs the event loop.
+
+class SLDServer(object):
+
+    def __init__(self, path=DEFAULT_SOCKET, loop=None, max_ops=DEFAULT_MAX_OPS):
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop    = loop
+        self.path    = path
+        self.max_ops = max_ops
+
+        self.devices = {}
+        self.clients = set()
+        self.server  = None
+
+    #----
+    #
+    # Open a device, arguments as for SLD_Controller. Clients use name.
+
+    def add_device(self, name, interface_name, m_width, n_width, **kwargs):
+        controller = AsyncSLDController(interface_name, m_width, n_width,
+                                        loop=self.loop, **kwargs)
+        self.devices[name] = DeviceChannel(name, controller, self.max_ops)
+
+    #----
+
+    def start(self):
+
+        # A socket left by a server that has exited is replaced
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                os.remove(self.path)
+            else:
+                raise SLDServerError('a server is already running on %s'
+                                     % self.path)
+            finally:
+                probe.close()
+
+        self.server = self.loop.run_until_complete(
+            self.loop.create_unix_server(self.connection, self.path))
+
+    #----
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.close()
+
+    #----
+
+    def connection(self):
+        client = ClientProtocol(self)
+        self.clients.add(client)
+        return client
+
+    #----
+
+    def request(self, client, request):
+
+        channel = self.devices.get(request.get('device'))
+        if channel is None:
+            client.reply(request, SLDServerError('no device %s'
+                                                 % request.get('device')))
+            return
+        channel.add(client, request)
+
+    #----
+
+    def drop(self, client):
+        self.clients.discard(client)
+        for channel in self.devices.values():
+            channel.drop(client)
+
+    #----
+    #
+    # Stop listening and close the devices after their queued operations
+
+    def close(self):
+
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+        closing = [channel.close() for channel in self.devices.values()]
+        self.devices = {}
+        if closing and not self.loop.is_running():
+            self.loop.run_until_complete(asyncio.wait(closing, loop=self.loop))
+
+#------------------------------------------------------------------------------
+#
+# Client
+#
+# The SLD_Controller operations, each sent to the server as one request.
+# Reads return a BitArray if the data was one, otherwise a BitVector, as
+# with SLD_Controller. session() queues operations and sends them as one
+# request, which runs without other clients' operations in between.
+#
+# Errors raised by the device are raised as SLDServerError.
+
+class SLDClient(object):
+
+    def __init__(self, device, path=DEFAULT_SOCKET):
+
+        self.device = device
+        self.path   = path
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.rfile = self.socket.makefile('rb')
+        self.next_id = 0
+
+    #----
+    #
+    # Send ops, a list of [method, args...], and wait for their results
+
+    def call(self, ops):
+
+        self.next_id += 1
+        request = {'id': self.next_id, 'device': self.device,
+                   'ops': [[op[0]] + [encode_value(a) for a in op[1:]]
+                           for op in ops]}
+        self.socket.sendall(encode_message(request))
+
+        line = self.rfile.readline()
+        if not line:
+            raise SLDServerError('server closed the connection')
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise SLDServerError(reply['error'])
+        return [decode_value(r) for r in reply['results']]
+
+    #----
+
+    def TAP_Reset(self):
+        self.call([['TAP_Reset']])
+
+    def IR_Write(self, instruction):
+        self.call([['IR_Write', instruction]])
+
+    def VIR_Write(self, node, instruction):
+        self.call([['VIR_Write', node, instruction]])
+
+    def VDR_Read(self, size):
+        return self.call([['VDR_Read', size]])[0]
+
+    def VDR_Write(self, data, size=None):
+        self.call([['VDR_Write', data, size]])
+
+    def VDR_Write_Read(self, data, size=None):
+        return self.call([['VDR_Write_Read', data, size]])[0]
+
+    def DR_Write_Read(self, data, size=None):
+        return self.call([['DR_Write_Read', data, size]])[0]
+
+    #----
+
+    def session(self):
+        return ClientSession(self)
+
+    #----
+
+    def close(self):
+        self.rfile.close()
+        self.socket.close()
+
+#------------------------------------------------------------------------------
+#
+# Operations queued on a client, like ScanSession. Leaving a "with
+# client.session() as s:" block calls run().
+
+class ClientResult(object):
+
+    def __init__(self, session):
+        self.session = session
+        self.value   = None
+        self.ready   = False
+
+    def done(self):
+        return self.ready
+
+    def result(self):
+        if not self.ready:
+            self.session.run()
+        return self.value
+
+#----
+
+class ClientSession(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.ops    = []
+        self.reads  = []
+
+    #----
+
+    def queue(self, op, read=False):
+        self.ops.append(op)
+        if read:
+            handle = ClientResult(self)
+            self.reads.append((len(self.ops) - 1, handle))
+            return handle
+
+    #----
+
+    def TAP_Reset(self):
+        self.queue(['TAP_Reset'])
+
+    def IR_Write(self, instruction):
+        self.queue(['IR_Write', instruction])
+
+    def VIR_Write(self, node, instruction):
+        self.queue(['VIR_Write', node, instruction])
+
+    def VDR_Write(self, data, size=None):
+        self.queue(['VDR_Write', data, size])
+
+    def VDR_Read(self, size):
+        return self.queue(['VDR_Read', size], True)
+
+    def VDR_Write_Read(self, data, size=None):
+        return self.queue(['VDR_Write_Read', data, size], True)
+
+    def DR_Write_Read(self, data, size=None):
+        return self.queue(['DR_Write_Read', data, size], True)
+
+    #----
+    #
+    # Send the queued operations and fill in the ClientResult handles
+
+    def run(self):
+
+        ops, self.ops = self.ops, []
+        reads, self.reads = self.reads, []
+        if not ops:
+            return
+
+        results = self.client.call(ops)
+        for i, handle in reads:
+            handle.value = results[i]
+            handle.ready = True
+
+    #----
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+        return False
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SLD device server')
+    parser.add_argument('devices', nargs='+',
+                        help="'SIM', USB-Blaster descriptions, or serial "
+                             "numbers with --serial")
+    parser.add_argument('-s', '--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('-m', '--m-width', type=int, default=None)
+    parser.add_argument('-n', '--n-width', type=int, default=None)
+    parser.add_argument('--serial', action='store_true',
+                        help='open devices by serial number')
+    parser.add_argument('--max-ops', type=int, default=DEFAULT_MAX_OPS,
+                        help='operations per client per round')
+    args = parser.parse_args()
+
+    server = SLDServer(args.socket, max_ops=args.max_ops)
+    for name in args.devices:
+        server.add_device(name, name, args.m_width, args.n_width,
+                          serial_number=name if args.serial else None)
+
+    print 'serving %s on %s' % (', '.join(args.devices), args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
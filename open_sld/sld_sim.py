@@ -0,0 +1,430 @@
+#------------------------------------------------------------------------------
+#
+#   sld_sim.py
+#
+#   A simulated USB-Blaster, FPGA TAP and SLD hub
+#
+#   SimulatedBlaster can be substituted for the ftdi.FTD2XX class. It runs
+#   the FT245 bit-mode and byte-shift commands written to it against an
+#   emulated JTAG TAP, with an SLD hub and virtual JTAG nodes behind the
+#   USER0/USER1 instructions, and returns the TDO data a real board would.
+#   PROGRAM and STARTUP take the device through configuration, but the
+#   bitstream is only counted, not checked. With config_length set, loads
+#   of any other length fail, like a bad bitstream.
+#
+#   SLD_Controller('SIM', ...) opens one with the InitialTest LED node.
+#
+#------------------------------------------------------------------------------
+
+from .sld_interface import TCK, TMS, TDI, RD, sHM
+from .jtag import JTAG_STATES
+
+#------------------------------------------------------------------------------
+#
+# Globals
+
+# Cyclone IV EP4CE22 (DE0-Nano)
+EP4CE22_IDCODE = 0x020F30DD
+
+IR_WIDTH     = 10
+IR_CAPTURE   = 0x155
+IR_PROGRAM   = 0x002
+IR_STARTUP   = 0x003
+IR_IDCODE    = 0x006
+IR_USERCODE  = 0x007
+IR_USER0     = 0x00C
+IR_USER1     = 0x00E
+IR_BYPASS    = 0x3FF
+
+ALTERA_MANUFACTURER = 0x06E
+VIRTUAL_JTAG_ID     = 0x08
+
+# TDO when the TAP isn't shifting, the USB-Blaster pulls it high
+TDO_IDLE = 1
+
+#------------------------------------------------------------------------------
+#
+# Data registers
+#
+# A register has a length, a capture() returning the value loaded in
+# Capture-DR, and update(value) called in Update-DR.
+
+class Register(object):
+
+    def __init__(self, length, value=0):
+        self.length = length
+        self.value  = value
+
+    def capture(self):
+        return self.value
+
+    def update(self, value):
+        pass
+
+#------------------------------------------------------------------------------
+#
+# Virtual JTAG nodes
+#
+# A node has its own virtual IR, set through the hub's VIR scan, and
+# returns the Register for the DR it selects.
+
+class VirtualNode(object):
+
+    def __init__(self, ir_width, node_id=VIRTUAL_JTAG_ID, instance=0,
+                 manufacturer=ALTERA_MANUFACTURER, version=1):
+
+        self.ir_width     = ir_width
+        self.node_id      = node_id
+        self.instance     = instance
+        self.manufacturer = manufacturer
+        self.version      = version
+        self.ir           = 0
+
+    #----
+
+    def info_word(self):
+        return ((self.version << 27) | (self.node_id << 19) |
+                (self.manufacturer << 8) | self.instance)
+
+    #----
+    #
+    # Default is a 1 bit bypass DR for every instruction
+
+    def register(self):
+        return Register(1)
+
+#----
+#
+# The InitialTest design: instruction 1 selects a 7 bit DR that drives the
+# LEDs. Capture-DR loads the current LED value, so a write-read returns the
+# previous value.
+
+class LEDNode(VirtualNode):
+
+    DR_LEDS = 1
+
+    def __init__(self, ir_width=4, width=7, **kwargs):
+        VirtualNode.__init__(self, ir_width, **kwargs)
+        self.width = width
+        self.leds  = 0
+
+    def register(self):
+        if self.ir == self.DR_LEDS:
+            return LEDRegister(self)
+        return Register(1)
+
+class LEDRegister(Register):
+
+    def __init__(self, node):
+        Register.__init__(self, node.width)
+        self.node = node
+
+    def capture(self):
+        return self.node.leds
+
+    def update(self, value):
+        self.node.leds = value
+
+#------------------------------------------------------------------------------
+#
+# SLD hub
+#
+# The virtual IR holds a node address above m instruction bits. Address 0
+# with instruction 0 (HUB_INFO) selects the hub itself, and each 4-bit
+# USER0 scan then captures the next nibble of the HUB_INFO word followed
+# by each node's NODE_INFO word.
+
+class SLDHub(object):
+
+    def __init__(self, nodes, version=1):
+
+        self.nodes   = list(nodes)
+        self.version = version
+        self.m_width = max([node.ir_width for node in self.nodes] + [1])
+        self.n_width = len(self.nodes).bit_length()
+
+        self.address    = 0
+        self.info_index = 0
+
+    #----
+
+    def info_word(self):
+        return ((self.version << 27) | (len(self.nodes) << 19) |
+                (ALTERA_MANUFACTURER << 8) | self.m_width)
+
+    #----
+
+    def info_nibble(self):
+        words = [self.info_word()] + [node.info_word() for node in self.nodes]
+        word = words[(self.info_index // 8) % len(words)]
+        nibble = (word >> (4 * (self.info_index % 8))) & 0xF
+        self.info_index += 1
+        return nibble
+
+    #----
+    #
+    # USER1 - the virtual IR
+
+    def vir_register(self):
+        return VIRRegister(self)
+
+    #----
+    #
+    # USER0 - the selected node's DR, or the hub information
+
+    def vdr_register(self):
+        if self.address == 0:
+            return HubInfoRegister(self)
+        return self.nodes[self.address - 1].register()
+
+class VIRRegister(Register):
+
+    def __init__(self, hub):
+        Register.__init__(self, hub.n_width + hub.m_width)
+        self.hub = hub
+
+    def update(self, value):
+        hub = self.hub
+        hub.address = value >> hub.m_width
+        instruction = value & ((1 << hub.m_width) - 1)
+        if hub.address == 0:
+            hub.info_index = 0
+        elif hub.address <= len(hub.nodes):
+            hub.nodes[hub.address - 1].ir = instruction
+
+class HubInfoRegister(Register):
+
+    def __init__(self, hub):
+        Register.__init__(self, 4)
+        self.hub = hub
+
+    def capture(self):
+        return self.hub.info_nibble()
+
+#------------------------------------------------------------------------------
+#
+# JTAG TAP controller
+
+class TAP(object):
+
+    def __init__(self, hub, idcode=EP4CE22_IDCODE, usercode=0xFFFFFFFF,
+                 configured=True, config_length=None):
+
+        self.hub      = hub
+        self.idcode   = idcode
+        self.usercode = usercode
+
+        # Configuration: PROGRAM clears the device and counts the bits
+        # shifted, STARTUP brings up the design (and the SLD hub) again
+        self.configured    = configured
+        self.config_bits   = 0
+        self.config_length = config_length
+
+        self.reset()
+
+    #----
+
+    def reset(self):
+        self.state    = 'reset'
+        self.ir       = IR_IDCODE
+        self.shift    = 0
+        self.length   = 0
+        self.register = None
+
+    #----
+    #
+    # The DR selected by the IR
+
+    def dr_register(self):
+        if self.ir == IR_IDCODE:
+            return Register(32, self.idcode)
+        if self.ir == IR_USERCODE:
+            return Register(32, self.usercode)
+        if self.ir == IR_USER1 and self.configured:
+            return self.hub.vir_register()
+        if self.ir == IR_USER0 and self.configured:
+            return self.hub.vdr_register()
+        return Register(1)
+
+    #----
+
+    def shifting(self):
+        return self.state in ('shift_dr', 'shift_ir')
+
+    #----
+
+    def tdo(self):
+        if self.shifting():
+            return self.shift & 1
+        return TDO_IDLE
+
+    #----
+    #
+    # One rising edge of TCK
+
+    def clock(self, tms, tdi):
+
+        if self.shifting():
+            self.shift = (self.shift >> 1) | (tdi << (self.length - 1))
+            if self.state == 'shift_dr' and self.ir == IR_PROGRAM:
+                self.config_bits += 1
+
+        self.state = JTAG_STATES[self.state][tms]
+
+        if self.state == 'reset':
+            self.reset()
+
+        elif self.state == 'capture_ir':
+            self.length = IR_WIDTH
+            self.shift  = IR_CAPTURE
+
+        elif self.state == 'update_ir':
+            self.ir = self.shift
+            if self.ir == IR_PROGRAM:
+                self.configured  = False
+                self.config_bits = 0
+            elif self.ir == IR_STARTUP and self.config_bits:
+                self.configured = self.config_length in (None, self.config_bits)
+
+        elif self.state == 'capture_dr':
+            self.register = self.dr_register()
+            self.length   = self.register.length
+            self.shift    = self.register.capture()
+
+        elif self.state == 'update_dr':
+            self.register.update(self.shift)
+
+    #----
+    #
+    # Eight rising edges with TMS = 0, shifting data LSB first. Returns
+    # the 8 TDO bits, first bit in the LSB.
+
+    def clock_byte(self, data):
+
+        if not self.shifting():
+            tdo = 0
+            for i in range(8):
+                tdo |= self.tdo() << i
+                self.clock(0, (data >> i) & 1)
+            return tdo
+
+        # Shift-DR/IR stays put with TMS = 0, so all 8 bits go at once
+        if self.state == 'shift_dr' and self.ir == IR_PROGRAM:
+            self.config_bits += 8
+        combined = self.shift | (data << self.length)
+        self.shift = combined >> 8
+        return combined & 0xFF
+
+#------------------------------------------------------------------------------
+#
+# The USB-Blaster
+#
+# Bit-mode bytes set the JTAG pins directly, a rising TCK clocks the TAP,
+# and RD returns TDO in bit 0 of a read byte. A byte with sHM set is
+# followed by up to 63 bytes shifted out LSB first with TMS = 0, each
+# returning a byte of TDO data if RD was also set.
+
+class SimulatedBlaster(object):
+
+    def __init__(self, nodes=None, serial_number=None, **tap_args):
+
+        if nodes is None:
+            nodes = [LEDNode()]
+        self.serial_number = serial_number
+
+        self.hub = SLDHub(nodes)
+        self.tap = TAP(self.hub, **tap_args)
+
+        self.tck        = 0
+        self.shift_left = 0
+        self.shift_read = False
+        self.rx         = bytearray()
+
+    #----
+    #
+    # Driver settings have no effect
+
+    def reset_device(self):
+        pass
+
+    def set_latency_timer(self, ucTimer=16):
+        pass
+
+    def set_usb_parameters(self, dwInTransferSize=4096, dwOutTransferSize=0):
+        pass
+
+    def set_timeouts(self, dwReadTimeout=100, dwWriteTimeout=100):
+        pass
+
+    def purge(self, to_purge='TXRX'):
+        if 'RX' in to_purge:
+            del self.rx[:]
+
+    def get_device_info(self):
+        return {'Type': 0, 'ID': 0,
+                'SerialNumber': self.serial_number or '',
+                'Description': 'USB-Blaster'}
+
+    #----
+
+    def write(self, buff):
+        return self.write_from(bytearray(buff))
+
+    #----
+
+    def write_from(self, data, offset=0, size=None):
+
+        if size is None:
+            size = len(data) - offset
+
+        tap = self.tap
+        rx  = self.rx
+        for b in bytearray(buffer(data, offset, size)):
+
+            if self.shift_left:
+                tdo = tap.clock_byte(b)
+                if self.shift_read:
+                    rx.append(tdo)
+                self.shift_left -= 1
+
+            elif b & sHM:
+                self.shift_left = b & 0x3F
+                self.shift_read = bool(b & RD)
+                self.tck = 0
+
+            else:
+                if b & RD:
+                    rx.append(tap.tdo())
+                tck = b & TCK
+                if tck and not self.tck:
+                    tap.clock(1 if b & TMS else 0, 1 if b & TDI else 0)
+                self.tck = tck
+
+        return size
+
+    #----
+
+    def get_queue_status(self):
+        return len(self.rx)
+
+    #----
+
+    def read(self, count, raw=True):
+        result = str(self.rx[:count])
+        del self.rx[:count]
+        return result
+
+    #----
+
+    def read_into(self, buff, offset=0, size=None):
+        if size is None:
+            size = len(buff) - offset
+        n = min(size, len(self.rx))
+        buff[offset:offset + n] = self.rx[:n]
+        del self.rx[:n]
+        return n
+
+    #----
+
+    def close(self):
+        pass
@@ -0,0 +1,387 @@
+#------------------------------------------------------------------------------
+#
+#   sld_stats.py
+#
+#   Counters and latency histograms for SLD_Controller operations
+#
+#   sld.enable_stats() replaces the controller's operation methods, and its
+#   interface, with timed and counting versions. Until then nothing is
+#   measured and nothing costs anything.
+#
+#------------------------------------------------------------------------------
+
+from time import time
+
+from .bits import bit_length
+
+# Operations timed per call
+TIMED_OPS = ('IR_Write', 'VIR_Write', 'VDR_Read', 'VDR_Write',
+             'VDR_Write_Read', 'DR_Write_Read')
+
+# Histogram buckets are powers of two microseconds
+HISTOGRAM_BUCKETS = 32
+
+#------------------------------------------------------------------------------
+#
+# Latency histogram
+#
+# Bucket 0 counts times under 1 us, bucket k times from 2**(k-1) to 2**k us.
+
+class LatencyHistogram(object):
+
+    def __init__(self):
+        self.reset()
+
+    #----
+
+    def reset(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count   = 0
+        self.total   = 0.0
+        self.min     = None
+        self.max     = None
+
+    #----
+
+    def add(self, seconds):
+        k = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.buckets[k] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    #----
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    #----
+    #
+    # Upper bound, in seconds, of the bucket holding the p'th percentile
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = self.count * p / 100.0
+        seen = 0
+        for k, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min((1 << k) * 1e-6, self.max)
+        return self.max
+
+    #----
+
+    def merge(self, other):
+        for k, n in enumerate(other.buckets):
+            self.buckets[k] += n
+        self.count += other.count
+        self.total += other.total
+        for t in (other.min, other.max):
+            if t is not None:
+                if self.min is None or t < self.min:
+                    self.min = t
+                if self.max is None or t > self.max:
+                    self.max = t
+
+    #----
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean(),
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'buckets_us': dict((1 << k, n) for k, n in enumerate(self.buckets)
+                                   if n)}
+
+#------------------------------------------------------------------------------
+#
+# Totals for one operation on one node
+
+class OpStats(object):
+
+    def __init__(self):
+        self.count   = 0
+        self.bits    = 0
+        self.errors  = 0
+        self.latency = LatencyHistogram()
+
+    #----
+
+    def merge(self, other):
+        self.count  += other.count
+        self.bits   += other.bits
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+    #----
+
+    def to_dict(self):
+        return {'count': self.count,
+                'bits': self.bits,
+                'errors': self.errors,
+                'latency': self.latency.to_dict()}
+
+#------------------------------------------------------------------------------
+#
+# SLDStats
+#
+# Statistics for one device. ops is keyed by (operation, node), node is
+# None for JTAG IR and DR operations. Callbacks are called after each
+# operation as fn(device, operation, node, bits, seconds, error), error
+# is None unless the operation raised.
+
+class SLDStats(object):
+
+    def __init__(self, device=None):
+        self.device    = device
+        self.callbacks = []
+        self.reset()
+
+    #----
+
+    def reset(self):
+
+        self.ops = {}
+
+        # USB traffic
+        self.usb_writes    = 0
+        self.bytes_written = 0
+        self.usb_reads     = 0
+        self.bytes_read    = 0
+        self.queue_polls   = 0
+
+        # Time spent in read_bytes waiting for read data
+        self.read_wait = LatencyHistogram()
+
+    #----
+
+    def add_callback(self, fn):
+        self.callbacks.append(fn)
+
+    def remove_callback(self, fn):
+        self.callbacks.remove(fn)
+
+    #----
+
+    def record(self, op, node, bits, seconds, error=None):
+
+        key = (op, node)
+        op_stats = self.ops.get(key)
+        if op_stats is None:
+            op_stats = self.ops[key] = OpStats()
+
+        if error is None:
+            op_stats.count += 1
+            op_stats.bits  += bits
+            op_stats.latency.add(seconds)
+        else:
+            op_stats.errors += 1
+
+        for fn in self.callbacks:
+            fn(self.device, op, node, bits, seconds, error)
+
+    #----
+    #
+    # Totals per operation over all nodes, and per node over all operations
+
+    def by_op(self):
+        return self.grouped(0)
+
+    def by_node(self):
+        return self.grouped(1)
+
+    def grouped(self, index):
+        totals = {}
+        for key, op_stats in self.ops.items():
+            total = totals.setdefault(key[index], OpStats())
+            total.merge(op_stats)
+        return totals
+
+    #----
+
+    def to_dict(self):
+        return {'device': self.device,
+                'usb_writes': self.usb_writes,
+                'bytes_written': self.bytes_written,
+                'usb_reads': self.usb_reads,
+                'bytes_read': self.bytes_read,
+                'queue_polls': self.queue_polls,
+                'read_wait': self.read_wait.to_dict(),
+                'ops': [dict(op=op, node=node, **op_stats.to_dict())
+                        for (op, node), op_stats in sorted(self.ops.items())]}
+
+    #----
+
+    def __repr__(self):
+        return ('SLDStats(device=%r, ops=%d, usb_writes=%d, bytes_written=%d, '
+                'bytes_read=%d)' % (self.device,
+                                    sum(s.count for s in self.ops.values()),
+                                    self.usb_writes, self.bytes_written,
+                                    self.bytes_read))
+
+#------------------------------------------------------------------------------
+#
+# Counting interface
+#
+# Wraps an FTD2XX (or CSV_Writer, SimulatedBlaster) and counts the USB
+# transfers and queue status polls. Everything else passes through.
+
+class CountingInterface(object):
+
+    def __init__(self, device, stats):
+        self.device = device
+        self.stats  = stats
+
+    #----
+
+    def write(self, buff):
+        n = self.device.write(buff)
+        self.stats.usb_writes += 1
+        self.stats.bytes_written += n
+        return n
+
+    def write_from(self, data, offset=0, size=None):
+        n = self.device.write_from(data, offset, size)
+        self.stats.usb_writes += 1
+        self.stats.bytes_written += n
+        return n
+
+    #----
+
+    def get_queue_status(self):
+        self.stats.queue_polls += 1
+        return self.device.get_queue_status()
+
+    #----
+
+    def read(self, count, raw=True):
+        data = self.device.read(count, raw)
+        self.stats.usb_reads += 1
+        self.stats.bytes_read += len(data)
+        return data
+
+    def read_into(self, buff, offset=0, size=None):
+        n = self.device.read_into(buff, offset, size)
+        self.stats.usb_reads += 1
+        self.stats.bytes_read += n
+        return n
+
+    #----
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+#------------------------------------------------------------------------------
+#
+# Install and remove the timed methods on an SLD_Controller. They are
+# instance attributes, so removing them restores the class methods.
+
+def instrument(sld, stats):
+
+    cls = type(sld)
+    for name in TIMED_OPS:
+        setattr(sld, name, timed_op(sld, stats, name, getattr(cls, name)))
+
+    sld.read_bytes = timed_read(sld, stats, cls.read_bytes)
+    sld.session    = timed_session(sld, stats, cls.session)
+
+    sld.interface = sld.queue.interface = CountingInterface(sld.interface, stats)
+
+#----
+
+def uninstrument(sld):
+
+    for name in TIMED_OPS + ('read_bytes', 'session'):
+        sld.__dict__.pop(name, None)
+
+    if isinstance(sld.interface, CountingInterface):
+        sld.interface = sld.queue.interface = sld.interface.device
+
+#----
+#
+# The node is the one addressed by VIR_Write, or the node selected for
+# a VDR operation
+
+def timed_op(sld, stats, name, method):
+
+    def op(*args, **kwargs):
+        start = time()
+        try:
+            result = method(sld, *args, **kwargs)
+        except Exception as e:
+            stats.record(name, op_node(sld, name, args), 0, time() - start, e)
+            raise
+        stats.record(name, op_node(sld, name, args), op_bits(name, args, kwargs),
+                     time() - start)
+        return result
+
+    return op
+
+def op_node(sld, name, args):
+    if name == 'VIR_Write':
+        return args[0]
+    if name.startswith('VDR'):
+        return sld.vir_node
+    return None
+
+#----
+#
+# Bits shifted: VDR_Read(size), VIR_Write(node, instruction), others
+# (data, size=None)
+
+def op_bits(name, args, kwargs):
+    if name == 'VDR_Read':
+        return args[0] if args else kwargs['size']
+    if name == 'VIR_Write':
+        return bit_length(args[1] if len(args) > 1 else kwargs['instruction']) or 0
+    data = args[0] if args else kwargs.get('data', kwargs.get('instruction'))
+    size = args[1] if len(args) > 1 else kwargs.get('size')
+    return bit_length(data, size) or 0
+
+#----
+
+def timed_read(sld, stats, method):
+
+    def read_bytes(count, timeout=None):
+        start = time()
+        try:
+            return method(sld, count, timeout)
+        finally:
+            stats.read_wait.add(time() - start)
+
+    return read_bytes
+
+#----
+#
+# A session is timed from run() to the last handle being filled in, and
+# counts the bits read
+
+def timed_session(sld, stats, method):
+
+    def session():
+        s = method(sld)
+        run = s.run
+
+        def timed_run():
+            bits = sum(handle.size for handle, count in s.reads)
+            start = time()
+            try:
+                run()
+            except Exception as e:
+                stats.record('ScanSession', sld.vir_node, 0, time() - start, e)
+                raise
+            stats.record('ScanSession', sld.vir_node, bits, time() - start)
+
+        s.run = timed_run
+        return s
+
+    return session
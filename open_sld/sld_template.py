@@ -0,0 +1,314 @@
+#------------------------------------------------------------------------------
+#
+#   sld_template.py
+#
+#   Compiled scan templates
+#
+#   A ScanTemplate records a sequence of SLD_Controller operations, and
+#   compiles it to the FT245 command bytes it sends. Data that changes from
+#   run to run is a Field, whose command bytes sit at known offsets in the
+#   compiled bytes. Each run() re-encodes only the fields whose values
+#   changed, and sends the whole template in one write.
+#
+#       leds = sld.template()
+#       leds.VIR_Write(1, 1)
+#       leds.VDR_Write_Read(leds.field(7))
+#       leds.VIR_Write(1, 0)
+#
+#       for d in range(128):
+#           read_back, = leds.run(d)
+#
+#   IR and virtual IR loads depend on what the controller's IR cache says
+#   is already loaded, so a template is compiled once for each IR cache
+#   state it starts from, and sends the same bytes the operations would.
+#   The controller's shift mode and virtual IR widths are part of that
+#   state too.
+#
+#   With the controller's statistics enabled, each run counts its
+#   operations as the controller would, sharing the run's time equally.
+#
+#------------------------------------------------------------------------------
+
+from time import time
+
+from .bits import BitVector, to_bits
+from .sld_interface import TAP_SHIFT_DR, TAP_END_SHIFT, USER0, read_count
+from .sld_stats import op_bits, op_node
+
+#------------------------------------------------------------------------------
+#
+# A variable data field of size bits, its value given to run()
+
+class Field(object):
+
+    def __init__(self, index, size):
+        self.index = index
+        self.size  = size
+
+    def __repr__(self):
+        return 'Field(%d, %d bits)' % (self.index, self.size)
+
+#------------------------------------------------------------------------------
+#
+# Takes the place of the controller's CommandQueue while a template is
+# compiled
+
+class Recorder(object):
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, buff):
+        self.buffer += buffer(buff)
+
+    def commit(self):
+        pass
+
+    def flush(self):
+        pass
+
+#------------------------------------------------------------------------------
+#
+# A template compiled for one IR cache state. locations[i] are the
+# (offset, length, rd) of field i's command bytes, values[i] the value
+# they hold. reads are the (bytes read, bits) of each read, in order, and
+# ops the (operation, node, bits) the statistics count.
+
+class CompiledTemplate(object):
+
+    def __init__(self, buffer, locations, reads, ops, ir, vir, vir_node):
+
+        self.buffer    = buffer
+        self.locations = locations
+        self.values    = [0] * len(locations)
+        self.reads     = reads
+        self.ops       = ops
+
+        # IR cache state after the template
+        self.ir       = ir
+        self.vir      = vir
+        self.vir_node = vir_node
+
+#------------------------------------------------------------------------------
+#
+# Operations take the same arguments as SLD_Controller's, and data can
+# also be a Field. Reads return the index of their result in the list
+# run() returns, results are BitVectors.
+#
+# Don't run a template while a ScanSession has reads outstanding.
+
+class ScanTemplate(object):
+
+    def __init__(self, sld):
+
+        self.sld    = sld
+        self.ops    = []
+        self.fields = []
+        self.nodes  = set()
+        self.resets = False
+
+        # Bits of each read, in order
+        self.reads = []
+
+        # CompiledTemplates, keyed by IR cache state
+        self.compiled = {}
+
+    #----
+
+    def field(self, size):
+        field = Field(len(self.fields), size)
+        self.fields.append(field)
+        return field
+
+    #----
+    #
+    # Operations
+
+    def TAP_Reset(self):
+        self.add('TAP_Reset')
+        self.resets = True
+
+    def IR_Write(self, instruction):
+        self.add('IR_Write', instruction)
+
+    def VIR_Write(self, node, instruction):
+        self.add('VIR_Write', node, instruction)
+        self.nodes.add(node)
+
+    def VDR_Write(self, data, size=None):
+        self.add('VDR_Write', self.data(data, size))
+
+    def VDR_Read(self, size):
+        return self.add_read('VDR_Read', BitVector(0, size))
+
+    def VDR_Write_Read(self, data, size=None):
+        return self.add_read('VDR_Write_Read', self.data(data, size))
+
+    def DR_Write_Read(self, data, size=None):
+        return self.add_read('DR_Write_Read', self.data(data, size))
+
+    #----
+
+    def add(self, *op):
+        self.ops.append(op)
+        self.compiled = {}
+
+    def add_read(self, method, data):
+        self.add(method, data)
+        self.reads.append(data.size if isinstance(data, Field) else len(data))
+        return len(self.reads) - 1
+
+    def data(self, data, size):
+        if isinstance(data, Field):
+            return data
+        return to_bits(data, size)
+
+    #----
+    #
+    # The controller state the compiled bytes depend on
+
+    def cache_key(self):
+        sld = self.sld
+        widths = (sld.byte_mode, sld.virtual_inst_width, sld.node_adrs_width)
+        if not sld.cache_ir:
+            return widths
+        return widths + (sld.ir, sld.vir_node,
+                         tuple(sorted((node, sld.vir.get(node))
+                                      for node in self.nodes)))
+
+    #----
+    #
+    # Record the operations from the controller's IR cache state
+
+    def compile(self):
+
+        sld = self.sld
+        recorder = Recorder()
+        buff = recorder.buffer
+        locations = [[] for field in self.fields]
+        reads = [(read_count(size, sld.byte_mode), size) for size in self.reads]
+        ops = []
+
+        saved = sld.queue, sld.ir, sld.vir, sld.vir_node
+        sld.queue = recorder
+        sld.vir = dict((node, sld.vir[node]) for node in self.nodes
+                       if node in sld.vir)
+        try:
+            for op in self.ops:
+                method, args = op[0], op[1:]
+
+                if method == 'TAP_Reset':
+                    sld.TAP_Reset()
+                    continue
+
+                if method == 'IR_Write':
+                    sld.load_ir(*args)
+                    size = op_bits(method, args, {})
+                elif method == 'VIR_Write':
+                    sld.load_vir(*args)
+                    size = op_bits(method, args, {})
+                else:
+                    data = args[0]
+                    rd = method != 'VDR_Write'
+                    if isinstance(data, Field):
+                        bits = BitVector(0, data.size)
+                    else:
+                        bits = data
+                    size = len(bits)
+
+                    if method != 'DR_Write_Read':
+                        sld.load_ir(USER0)
+                    buff += buffer(TAP_SHIFT_DR)
+                    offset = len(buff)
+                    buff += sld.shiftBuffer(bits, rd)
+                    if isinstance(data, Field):
+                        locations[data.index].append((offset, len(buff) - offset, rd))
+                    buff += buffer(TAP_END_SHIFT)
+
+                ops.append((method, op_node(sld, method, args), size))
+
+            return CompiledTemplate(buff, locations, reads, ops, sld.ir,
+                                    sld.vir, sld.vir_node)
+        finally:
+            sld.queue, sld.ir, sld.vir, sld.vir_node = saved
+
+    #----
+    #
+    # Send the template with values for its fields, in the order they were
+    # created. Returns the results of its reads.
+
+    def run(self, *values):
+
+        if len(values) != len(self.fields):
+            raise ValueError('template has %d fields, %d values given'
+                             % (len(self.fields), len(values)))
+
+        sld = self.sld
+        key = self.cache_key()
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            compiled = self.compiled[key] = self.compile()
+
+        if sld.stats is None:
+            return self.send(compiled, values)
+
+        start = time()
+        try:
+            results = self.send(compiled, values)
+        except Exception as e:
+            self.record(compiled, time() - start, e)
+            raise
+        self.record(compiled, time() - start)
+        return results
+
+    #----
+
+    def send(self, compiled, values):
+
+        sld = self.sld
+
+        # Re-encode the fields that changed
+        buff = compiled.buffer
+        for i, value in enumerate(values):
+            bits = to_bits(value, self.fields[i].size)
+            uint = bits.uint if len(bits) else 0
+            if uint == compiled.values[i]:
+                continue
+            compiled.values[i] = uint
+            encoded = {}
+            for offset, length, rd in compiled.locations[i]:
+                if rd not in encoded:
+                    encoded[rd] = sld.shiftBuffer(bits, rd)
+                buff[offset:offset + length] = encoded[rd]
+
+        sld.queue.write(buff)
+
+        # The IR cache as the template leaves it
+        if self.resets:
+            sld.vir = {}
+        sld.vir.update(compiled.vir)
+        sld.ir, sld.vir_node = compiled.ir, compiled.vir_node
+
+        if not self.reads:
+            sld.queue.commit()
+            return []
+
+        sld.queue.flush()
+        total = sum(count for count, size in compiled.reads)
+        rx_data = sld.read_bytes(total)
+
+        results = []
+        offset = 0
+        for count, size in compiled.reads:
+            results.append(sld.rx_decode(rx_data[offset:offset + count], size,
+                                         False))
+            offset += count
+        return results
+
+    #----
+
+    def record(self, compiled, seconds, error=None):
+        stats = self.sld.stats
+        share = seconds / len(compiled.ops) if compiled.ops else 0.0
+        for method, node, bits in compiled.ops:
+            stats.record(method, node, 0 if error else bits, share, error)
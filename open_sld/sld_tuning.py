@@ -0,0 +1,122 @@
+#------------------------------------------------------------------------------
+#
+#   sld_tuning.py
+#
+#   USB transfer settings for the FT245, and a routine that measures a few
+#   settings and picks the best
+#
+#------------------------------------------------------------------------------
+
+from time import time
+from .bits import BitVector
+
+# USB full speed bulk packet size, transfer sizes are multiples of this
+USB_PACKET_SIZE = 64
+
+# Largest transfer size the d2xx driver accepts
+MAX_USB_TRANSFER = 65536
+
+# JTAG BYPASS instruction - a 1 bit DR, so any length can be shifted
+# through it without touching the design
+BYPASS = BitVector(0x3FF, 10)
+
+#------------------------------------------------------------------------------
+#
+# Round down to a whole number of USB packets, within the driver's limits
+
+def aligned(size):
+    size = min(size, MAX_USB_TRANSFER)
+    return max(USB_PACKET_SIZE, size - size % USB_PACKET_SIZE)
+
+#------------------------------------------------------------------------------
+#
+# Transfer profile
+#
+# The driver defaults are a 16 ms latency timer and 4 kB transfers. Short
+# reads are returned when the latency timer expires, so 16 ms limits a
+# polling loop to about 60 reads per second.
+
+class TransferProfile(object):
+
+    def __init__(self, latency_timer=2, in_transfer_size=MAX_USB_TRANSFER,
+                 out_transfer_size=MAX_USB_TRANSFER, read_timeout=1000,
+                 write_timeout=1000):
+
+        self.latency_timer     = latency_timer
+        self.in_transfer_size  = aligned(in_transfer_size)
+        self.out_transfer_size = aligned(out_transfer_size)
+        self.read_timeout      = read_timeout
+        self.write_timeout     = write_timeout
+
+    #----
+    #
+    # Configure a device. Interfaces without the d2xx settings, like
+    # CSV_Writer, are left alone.
+
+    def apply(self, device):
+
+        if not hasattr(device, 'set_latency_timer'):
+            return
+
+        device.set_latency_timer(self.latency_timer)
+        device.set_usb_parameters(self.in_transfer_size, self.out_transfer_size)
+        device.set_timeouts(self.read_timeout, self.write_timeout)
+
+    #----
+    #
+    # Size of each write handed to the driver
+
+    def chunk_size(self):
+        return self.out_transfer_size
+
+    #----
+
+    def __repr__(self):
+        return ('TransferProfile(latency_timer=%d, in_transfer_size=%d, '
+                'out_transfer_size=%d)' % (self.latency_timer,
+                                           self.in_transfer_size,
+                                           self.out_transfer_size))
+
+DEFAULT_PROFILE = TransferProfile()
+
+#------------------------------------------------------------------------------
+#
+# Calibration
+#
+# For each candidate profile, measures the round trip time of short reads
+# and the throughput of one long read, shifted through the BYPASS register.
+# The best profile is the one with the lowest cost for a read of
+# typical_bits, and is left applied. Returns (best profile, results), where
+# results is a list of (profile, round trip seconds, bits per second, cost).
+#
+# The JTAG IR is left holding BYPASS.
+
+CANDIDATE_PROFILES = [TransferProfile(latency_timer=t, in_transfer_size=s,
+                                      out_transfer_size=s)
+                      for t in (1, 2, 4, 16)
+                      for s in (4096, MAX_USB_TRANSFER)]
+
+def calibrate(sld, profiles=CANDIDATE_PROFILES, round_trips=50,
+              long_read_bits=65536, typical_bits=1024):
+
+    results = []
+    for profile in profiles:
+
+        sld.apply_profile(profile)
+        sld.IR_Write(BYPASS)
+
+        start = time()
+        for i in range(round_trips):
+            sld.DR_Write_Read(BitVector(0, 8))
+        round_trip = (time() - start) / round_trips
+
+        start = time()
+        sld.DR_Write_Read(BitVector(0, long_read_bits))
+        throughput = long_read_bits / max(time() - start - round_trip, 1e-6)
+
+        cost = round_trip + typical_bits / throughput
+        results.append((profile, round_trip, throughput, cost))
+
+    best = min(results, key=lambda r: r[3])[0]
+    sld.apply_profile(best)
+    return best, results
@@ -0,0 +1,76 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_async.py
+#
+#   AsyncSLDController limits and shutdown on the simulator
+#
+#------------------------------------------------------------------------------
+
+import unittest
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+#------------------------------------------------------------------------------
+
+@unittest.skipIf(asyncio is None, 'needs asyncio or trollius')
+class AsyncControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        from open_sld.sld_async import AsyncSLDController
+        self.loop = asyncio.new_event_loop()
+        self.sld = AsyncSLDController('SIM', 4, 1, loop=self.loop,
+                                      max_pending=2, max_waiting=3)
+
+    def tearDown(self):
+        if not self.sld.closed:
+            self.wait(self.sld.close())
+        self.loop.close()
+
+    def wait(self, future):
+        return self.loop.run_until_complete(future)
+
+    def test_size_is_passed_through(self):
+        self.wait(self.sld.vir_write(1, 1))
+        self.wait(self.sld.vdr_write(0x55, 7))
+        self.assertEqual(self.wait(self.sld.vdr_write_read(0x2A, 7)).uint, 0x55)
+        self.assertEqual(self.wait(self.sld.vdr_read(7)).uint, 0x2A)
+
+    def test_queue_full(self):
+        from open_sld.sld_async import SLDQueueFullError
+        futures = [self.sld.vdr_read(7) for i in range(6)]
+        self.assertEqual(self.sld.outstanding(), 5)
+        self.assertIsInstance(futures[-1].exception(), SLDQueueFullError)
+
+        # The accepted operations complete, and there is room again
+        self.wait(asyncio.wait(futures[:-1], loop=self.loop))
+        self.assertEqual(self.sld.outstanding(), 0)
+        self.assertEqual(len(self.wait(self.sld.vdr_read(7))), 7)
+
+    def test_closed(self):
+        from open_sld.sld_async import SLDClosedError
+        self.wait(self.sld.close())
+        future = self.sld.vdr_read(7)
+        self.assertTrue(future.done())
+        self.assertIsInstance(future.exception(), SLDClosedError)
+
+    def test_close_when_full(self):
+        futures = [self.sld.vdr_read(7) for i in range(6)]
+        self.assertEqual(self.sld.outstanding(), 5)
+
+        # The close waits behind the accepted operations, and stops the
+        # I/O thread
+        self.assertIsNone(self.wait(self.sld.close()))
+        self.assertTrue(all(f.done() for f in futures))
+        self.sld.thread.join(5)
+        self.assertFalse(self.sld.thread.is_alive())
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
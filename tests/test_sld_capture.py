@@ -0,0 +1,131 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_capture.py
+#
+#   Streaming VDR capture on the simulator
+#
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from open_sld.sld_capture import VDRCapture, SampleRing, read_ring_file
+from open_sld.sld_interface import SLD_Controller, load_numpy
+from open_sld.sld_sim import SimulatedBlaster, VirtualNode, Register
+
+#------------------------------------------------------------------------------
+#
+# A node whose DR captures the next value of a counter on every scan
+
+class CounterNode(VirtualNode):
+
+    def __init__(self, width):
+        VirtualNode.__init__(self, 4)
+        self.width = width
+        self.count = 0
+
+    def register(self):
+        return CounterRegister(self)
+
+class CounterRegister(Register):
+
+    def __init__(self, node):
+        Register.__init__(self, node.width)
+        self.node = node
+
+    def capture(self):
+        value = self.node.count
+        self.node.count += 1
+        return value
+
+#------------------------------------------------------------------------------
+
+class CaptureTest(unittest.TestCase):
+
+    def controller(self, width, **kwargs):
+        self.node = CounterNode(width)
+        self.blaster = SimulatedBlaster([self.node])
+        return SLD_Controller('SIM', 4, 1, device=self.blaster, profile=None,
+                              **kwargs)
+
+    def assertCounts(self, samples, start, count):
+        self.assertEqual([int(s) for s in samples], range(start, start + count))
+
+    #----
+
+    def test_batches(self):
+        for byte_mode in (True, False):
+            sld = self.controller(20, byte_mode=byte_mode)
+            capture = VDRCapture(sld, 1, 3, 20, batch=8)
+            batches = list(capture.batches(count=5))
+
+            self.assertEqual([len(b) for b in batches], [8] * 5)
+            self.assertCounts(sum([list(b) for b in batches], []), 0, 40)
+            self.assertEqual(capture.samples, 40)
+            self.assertEqual(len(self.blaster.rx), 0)
+
+    def test_wide_samples(self):
+        sld = self.controller(80)
+        self.node.count = 1 << 70
+        batches = list(VDRCapture(sld, 1, 3, 80, batch=4).batches(count=2))
+        self.assertEqual(sum(batches, []), range(1 << 70, (1 << 70) + 8))
+
+    def test_early_stop_reads_in_flight(self):
+        sld = self.controller(16)
+        capture = VDRCapture(sld, 1, 3, 16, batch=4)
+        batches = capture.batches()
+        self.assertCounts(next(batches), 0, 4)
+        batches.close()
+
+        # Batches in flight were read and dropped, the stream is in step
+        self.assertEqual(len(self.blaster.rx), 0)
+        sld.VIR_Write(1, 3)
+        self.assertEqual(sld.VDR_Write_Read(0, 16).uint, self.node.count - 1)
+
+    def test_thread_and_ring(self):
+        sld = self.controller(12)
+        seen = []
+        with VDRCapture(sld, 1, 3, 12, batch=16, depth=1024,
+                        callbacks=[seen.append]) as capture:
+            samples = []
+            while len(samples) < 100:
+                samples += capture.read(timeout=1.0)
+
+        self.assertCounts(samples, 0, len(samples))
+        self.assertCounts(sum([list(b) for b in seen], []), 0, 16 * len(seen))
+
+    #----
+
+    def test_ring_drops_oldest(self):
+        ring = SampleRing(8, 16)
+        ring.extend(range(5))
+        self.assertEqual([int(v) for v in ring.take(3)], [0, 1, 2])
+        ring.extend(range(5, 15))
+        self.assertEqual(ring.available(), 8)
+        self.assertEqual([int(v) for v in ring.take()], range(7, 15))
+        self.assertEqual(ring.dropped, 4)
+
+    @unittest.skipUnless(load_numpy(), 'needs NumPy')
+    def test_ring_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'ring')
+            sld = self.controller(24)
+            capture = VDRCapture(sld, 1, 3, 24, batch=16, depth=40,
+                                 file_name=file_name)
+            for samples in capture.batches(count=3):
+                capture.ring.extend(samples)
+            capture.ring.close()
+
+            width, written, held = read_ring_file(file_name)
+            self.assertEqual((width, written), (24, 48))
+            self.assertCounts(held, 8, 40)
+        finally:
+            shutil.rmtree(directory)
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_config.py
+#
+#   FPGA configuration on the simulator
+#
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from open_sld.sld_config import (Bitstream, ConfigurationError, FingerprintCache,
+                                 configure, read_sof, read_idcode)
+from open_sld.sld_interface import SLD_Controller
+from open_sld.sld_sim import SimulatedBlaster, EP4CE22_IDCODE
+
+SOF_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'InitialTest.sof')
+
+BITSTREAM = Bitstream('\x5A' * 200 + '\x03', 1605, 'EP4CE22F17C6')
+
+#------------------------------------------------------------------------------
+
+class ConfigureTest(unittest.TestCase):
+
+    def controller(self, **kwargs):
+        self.blaster = SimulatedBlaster(**kwargs)
+        return SLD_Controller('SIM', 4, 1, device=self.blaster, profile=None)
+
+    #----
+
+    def test_configure(self):
+        for byte_mode in (True, False):
+            sld = self.controller(configured=False)
+            sld.byte_mode = byte_mode
+            self.assertTrue(configure(sld, BITSTREAM, fingerprint_file=None))
+            self.assertEqual(self.blaster.tap.config_bits, 1605)
+            self.assertTrue(self.blaster.tap.configured)
+
+            # The LED node answers again
+            sld.VIR_Write(1, 1)
+            sld.VDR_Write(0x33, 7)
+            self.assertEqual(sld.VDR_Write_Read(0, 7).uint, 0x33)
+
+    def test_failed_load_raises(self):
+        sld = self.controller(config_length=1604)
+        with self.assertRaises(ConfigurationError):
+            configure(sld, BITSTREAM, fingerprint_file=None)
+        self.assertFalse(self.blaster.tap.configured)
+
+    def test_wrong_device(self):
+        sld = self.controller()
+        with self.assertRaises(ConfigurationError):
+            configure(sld, Bitstream('\x00' * 8, device='EP4CE6E22C8'),
+                      fingerprint_file=None)
+        self.assertEqual(read_idcode(sld), EP4CE22_IDCODE)
+
+    def test_read_sof(self):
+        bitstream = read_sof(SOF_FILE)
+        self.assertEqual(bitstream.device, 'EP4CE22F17C6')
+        self.assertEqual(bitstream.idcode(), EP4CE22_IDCODE)
+        self.assertEqual(len(bitstream.data), (bitstream.bits + 7) // 8)
+
+#------------------------------------------------------------------------------
+
+class FingerprintCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'fingerprints.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def controller(self, serial_number='A1', **kwargs):
+        self.blaster = SimulatedBlaster(serial_number=serial_number, **kwargs)
+        return SLD_Controller('SIM', 4, 1, device=self.blaster, profile=None)
+
+    def configure(self, sld, bitstream=BITSTREAM, **kwargs):
+        return configure(sld, bitstream, fingerprint_file=self.file_name,
+                         **kwargs)
+
+    #----
+
+    def test_round_trip(self):
+        sld = self.controller()
+        self.assertEqual(sld.serial_number, 'A1')
+        self.assertTrue(self.configure(sld))
+        entry = FingerprintCache(self.file_name).entries['A1']
+        self.assertEqual(entry['bitstream'], BITSTREAM.digest())
+
+        # Already configured with it
+        self.assertFalse(self.configure(sld))
+        self.assertTrue(self.configure(sld, force=True))
+
+        # Another bitstream is loaded
+        other = Bitstream('\xA5' * 200 + '\x03', 1605, 'EP4CE22F17C6')
+        self.assertTrue(self.configure(sld, other))
+        self.assertFalse(self.configure(sld, other))
+        self.assertTrue(self.configure(sld))
+        self.assertEqual(os.listdir(self.directory), ['fingerprints.json'])
+
+    def test_other_device_is_configured(self):
+        self.configure(self.controller())
+        self.assertTrue(self.configure(self.controller('B2')))
+        self.assertEqual(sorted(FingerprintCache(self.file_name).entries),
+                         ['A1', 'B2'])
+
+    def test_no_serial_number_is_not_cached(self):
+        sld = self.controller(serial_number=None)
+        self.assertIsNone(sld.serial_number)
+        self.assertTrue(self.configure(sld))
+        self.assertTrue(self.configure(sld))
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_failed_load_is_forgotten(self):
+        sld = self.controller()
+        self.configure(sld)
+
+        self.blaster.tap.config_length = 1604
+        with self.assertRaises(ConfigurationError):
+            self.configure(sld, force=True)
+        self.assertNotIn('A1', FingerprintCache(self.file_name).entries)
+
+        # So the next configure isn't skipped
+        self.blaster.tap.config_length = None
+        self.assertTrue(self.configure(sld))
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
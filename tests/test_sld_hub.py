@@ -0,0 +1,106 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_hub.py
+#
+#   Hub enumeration and the topology cache, on the simulator
+#
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from open_sld.sld_hub import TopologyCache, HubInfo, ALTERA_MANUFACTURER
+from open_sld.sld_interface import SLD_Controller
+from open_sld.sld_sim import SimulatedBlaster, LEDNode, VirtualNode
+
+#------------------------------------------------------------------------------
+
+class TopologyCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'topology.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def controller(self, design='InitialTest', **kwargs):
+        return SLD_Controller('SIM', None, None, design=design,
+                              topology_file=self.file_name, profile=None,
+                              **kwargs)
+
+    #----
+
+    def test_round_trip(self):
+        sld = self.controller()
+        self.assertEqual((sld.virtual_inst_width, sld.node_adrs_width), (4, 1))
+        self.assertEqual(sld.hub.manufacturer, ALTERA_MANUFACTURER)
+
+        hub = TopologyCache(self.file_name).get('SIM', 'InitialTest')
+        self.assertEqual(hub.to_dict(), sld.hub.to_dict())
+
+        # A device with a different hub gets the cached topology
+        nodes = [LEDNode(), VirtualNode(6), VirtualNode(2)]
+        sld = self.controller(device=SimulatedBlaster(nodes))
+        self.assertEqual((sld.virtual_inst_width, sld.node_adrs_width), (4, 1))
+
+        # and its own when refreshed
+        hub = sld.discover('InitialTest', self.file_name, refresh=True)
+        self.assertEqual((hub.m_width, hub.n_width, hub.node_count), (6, 2, 3))
+        self.assertEqual(TopologyCache(self.file_name).get('SIM', 'InitialTest')
+                         .m_width, 6)
+
+    def test_no_design_is_not_cached(self):
+        sld = self.controller(design=None)
+        self.assertEqual(sld.virtual_inst_width, 4)
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_unconfigured_device_is_not_cached(self):
+        sld = self.controller(device=SimulatedBlaster(configured=False))
+        self.assertFalse(sld.hub.valid())
+        self.assertFalse(os.path.exists(self.file_name))
+
+    def test_saves_keep_other_entries(self):
+        first  = TopologyCache(self.file_name)
+        second = TopologyCache(self.file_name)
+        first.put('A', 'x', HubInfo(1, 1, ALTERA_MANUFACTURER, 4))
+        second.put('B', 'x', HubInfo(1, 2, ALTERA_MANUFACTURER, 5))
+        first.put('A', 'y', HubInfo(1, 3, ALTERA_MANUFACTURER, 6))
+
+        cache = TopologyCache(self.file_name)
+        self.assertEqual(sorted(cache.entries), ['A/x', 'A/y', 'B/x'])
+        self.assertEqual(cache.get('B', 'x').m_width, 5)
+        self.assertEqual(os.listdir(self.directory), ['topology.json'])
+
+        cache.forget('A', 'x')
+        self.assertIsNone(TopologyCache(self.file_name).get('A', 'x'))
+
+    def test_damaged_file(self):
+        with open(self.file_name, 'w') as f:
+            f.write('{not json')
+        self.assertEqual(TopologyCache(self.file_name).entries, {})
+        self.controller()
+        self.assertIsNotNone(TopologyCache(self.file_name).get('SIM', 'InitialTest'))
+
+    #----
+
+    def test_discover_forgets_vir(self):
+        self.controller()
+        sld = SLD_Controller('SIM', 4, 1, profile=None)
+        sld.VIR_Write(1, 1)
+
+        # From the cache, without enumerating
+        sld.discover('InitialTest', self.file_name)
+        self.assertEqual((sld.vir, sld.vir_node), ({}, None))
+
+        # The next VIR write is sent, and selects the LED register again
+        sld.VIR_Write(1, 1)
+        sld.VDR_Write(0x5A, 7)
+        self.assertEqual(sld.VDR_Write_Read(0, 7).uint, 0x5A)
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
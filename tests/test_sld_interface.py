@@ -0,0 +1,80 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_interface.py
+#
+#   SLD_Controller reads against the simulated USB-Blaster
+#
+#------------------------------------------------------------------------------
+
+import unittest
+
+from open_sld.sld_interface import SLD_Controller, SLDTimeoutError
+from open_sld.sld_sim import SimulatedBlaster
+
+#------------------------------------------------------------------------------
+#
+# A SimulatedBlaster that holds back the last hold bytes of its RX queue,
+# as if they were late. FT_Purge RX discards them with the rest.
+
+class LateBlaster(SimulatedBlaster):
+
+    def __init__(self, **kwargs):
+        SimulatedBlaster.__init__(self, **kwargs)
+        self.hold = 0
+
+    def get_queue_status(self):
+        return max(0, len(self.rx) - self.hold)
+
+    def read_into(self, buff, offset=0, size=None):
+        if size is None:
+            size = len(buff) - offset
+        return SimulatedBlaster.read_into(self, buff, offset,
+                                          min(size, self.get_queue_status()))
+
+#------------------------------------------------------------------------------
+
+class ReadTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blaster = LateBlaster()
+        self.sld = SLD_Controller('SIM', 4, 1, device=self.blaster,
+                                  read_timeout=0.05, profile=None)
+        self.sld.VIR_Write(1, 1)
+        self.sld.VDR_Write_Read(0x15, 7)
+
+    def test_late_bytes_are_discarded(self):
+        self.blaster.hold = 1
+        with self.assertRaises(SLDTimeoutError) as cm:
+            self.sld.VDR_Write_Read(0x2A, 7)
+        self.assertEqual(cm.exception.expected, 7)
+        self.assertEqual(cm.exception.received, 6)
+        self.assertEqual(len(self.blaster.rx), 0)
+
+        # The next read gets its own data, not the late byte
+        self.blaster.hold = 0
+        self.assertEqual(self.sld.VDR_Write_Read(0x0F, 7).uint, 0x2A)
+
+    def test_dropped_bytes(self):
+        self.blaster.hold = 7
+        with self.assertRaises(SLDTimeoutError) as cm:
+            self.sld.VDR_Write_Read(0x33, 7)
+        self.assertEqual(cm.exception.received, 0)
+
+        self.blaster.hold = 0
+        self.assertEqual(self.sld.VDR_Write_Read(0x44, 7).uint, 0x33)
+        self.assertEqual(self.sld.VDR_Write_Read(0, 7).uint, 0x44)
+
+    def test_bit_mode(self):
+        sld = SLD_Controller('SIM', 4, 1, device=self.blaster, byte_mode=False,
+                             read_timeout=0.05, profile=None)
+        sld.VIR_Write(1, 1)
+        self.blaster.hold = 2
+        with self.assertRaises(SLDTimeoutError):
+            sld.VDR_Write_Read(0x7F, 7)
+        self.blaster.hold = 0
+        self.assertEqual(sld.VDR_Write_Read(0, 7).uint, 0x7F)
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_pool.py
+#
+#   DevicePool health and failover, with simulated USB-Blasters in place
+#   of the d2xx devices
+#
+#------------------------------------------------------------------------------
+
+import unittest
+
+from open_sld import sld_pool
+from open_sld.sld_interface import SLD_Controller
+
+#------------------------------------------------------------------------------
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broken = set()
+        self.saved = sld_pool.SLD_Controller, sld_pool.get_device_info_list
+        sld_pool.SLD_Controller = self.open_controller
+        sld_pool.get_device_info_list = lambda: []
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+        sld_pool.SLD_Controller, sld_pool.get_device_info_list = self.saved
+
+    #----
+    #
+    # Opens a simulator, unless the serial number is in broken
+
+    def open_controller(self, interface_name, m_width, n_width,
+                        serial_number=None, **kwargs):
+        if serial_number in self.broken:
+            raise IOError('cannot open %s' % serial_number)
+        return SLD_Controller('SIM', m_width, n_width, profile=None, **kwargs)
+
+    def open_pool(self, **kwargs):
+        self.pool = sld_pool.DevicePool(4, 1, serials=['A', 'B'], **kwargs)
+
+        # Wait for both workers to try to open their device
+        for serial in self.pool.serials():
+            self.pool.submit(serial, lambda sld: None).event.wait(5)
+        return self.pool
+
+    #----
+
+    def test_open_failure(self):
+        self.broken.add('B')
+        pool = self.open_pool()
+
+        self.assertTrue(pool.workers['A'].healthy)
+        self.assertFalse(pool.workers['B'].healthy)
+        self.assertTrue(pool.health()['B']['open_failed'])
+
+        # All the work goes to the open device
+        jobs = [pool.dispatch(lambda sld: sld.VDR_Write_Read(0, 7))
+                for i in range(6)]
+        for job in jobs:
+            self.assertEqual(len(job.result(5)), 7)
+        self.assertEqual(sorted(pool.map(lambda sld: None)), ['A'])
+
+        # Until the device opens again
+        self.broken.clear()
+        pool.workers['B'].reopen().result(5)
+        self.assertTrue(pool.workers['B'].healthy)
+
+    def test_failed_reopen(self):
+        pool = self.open_pool()
+        self.broken.add('A')
+        with self.assertRaises(IOError):
+            pool.workers['A'].reopen().result(5)
+        self.assertFalse(pool.workers['A'].healthy)
+
+    #----
+
+    def test_failover(self):
+        pool = self.open_pool(max_failures=2)
+
+        def fail(sld):
+            raise RuntimeError('scan failed')
+
+        for i in range(2):
+            with self.assertRaises(RuntimeError):
+                pool.submit('A', fail).result(5)
+        self.assertFalse(pool.workers['A'].healthy)
+
+        done = pool.workers['B'].jobs_done
+        for i in range(4):
+            pool.dispatch(lambda sld: None).result(5)
+        self.assertEqual(pool.workers['B'].jobs_done, done + 4)
+
+        # A reopened device gets work again
+        pool.workers['A'].reopen().result(5)
+        self.assertTrue(pool.workers['A'].healthy)
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_server.py
+#
+#   Round-robin scheduling of several clients on one simulated device
+#
+#------------------------------------------------------------------------------
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+from open_sld.sld_sim import SimulatedBlaster, LEDNode
+
+#------------------------------------------------------------------------------
+#
+# Collects the replies sent to a ClientProtocol
+
+class Transport(object):
+
+    def __init__(self, test, name):
+        self.test = test
+        self.name = name
+
+    def write(self, data):
+        self.test.replied(self.name, json.loads(data))
+
+#------------------------------------------------------------------------------
+
+@unittest.skipIf(asyncio is None, 'needs asyncio or trollius')
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        from open_sld.sld_server import SLDServer
+        self.directory = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+
+        # Three LED nodes, one for each client
+        self.blaster = SimulatedBlaster([LEDNode(), LEDNode(), LEDNode()])
+        self.server = SLDServer(os.path.join(self.directory, 'sld.sock'),
+                                self.loop, max_ops=1)
+        self.server.add_device('SIM', 'SIM', 4, 2, device=self.blaster,
+                               profile=None)
+
+        self.replies  = []
+        self.expected = 0
+        self.done     = None
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    #----
+
+    def client(self, name):
+        client = self.server.connection()
+        client.connection_made(Transport(self, name))
+        return client
+
+    def send(self, client, *ops):
+        self.expected += 1
+        client.data_received(json.dumps({'id': self.expected, 'device': 'SIM',
+                                         'ops': list(ops)}) + '\n')
+
+    def replied(self, name, reply):
+        self.replies.append((name, reply))
+        if len(self.replies) == self.expected and self.done is not None:
+            self.done.set_result(None)
+
+    def wait(self):
+        self.done = asyncio.Future(loop=self.loop)
+        if len(self.replies) < self.expected:
+            self.loop.run_until_complete(
+                asyncio.wait_for(self.done, 10, loop=self.loop))
+
+    #----
+
+    def test_round_robin(self):
+        a, b, c = self.client('a'), self.client('b'), self.client('c')
+
+        # The first request starts a round, the rest wait for it
+        self.send(a, ['VIR_Write', 1, 1], ['VDR_Write_Read', 0x10, 7])
+        for value in (0x11, 0x12, 0x13):
+            self.send(a, ['VDR_Write_Read', value, 7])
+        self.send(b, ['VIR_Write', 2, 1], ['VDR_Write_Read', 0x20, 7])
+        self.send(c, ['VIR_Write', 3, 1], ['VDR_Write_Read', 0x30, 7])
+        self.send(c, ['VDR_Write_Read', 0x31, 7])
+        self.wait()
+
+        # One request per client each round, starting with the next client
+        channel = self.server.devices['SIM']
+        self.assertEqual(channel.rounds, 4)
+        self.assertEqual(channel.requests, 7)
+        self.assertEqual([name for name, reply in self.replies],
+                         ['a', 'a', 'b', 'c', 'c', 'a', 'a'])
+
+        # Each client's reads come from its own node, as it selected it
+        reads = {}
+        for name, reply in self.replies:
+            self.assertNotIn('error', reply)
+            reads.setdefault(name, []).append(reply['results'][-1]['bits'])
+        self.assertEqual(reads, {'a': ['0', '10', '11', '12'],
+                                 'b': ['0'],
+                                 'c': ['0', '30']})
+        self.assertEqual([node.leds for node in self.blaster.tap.hub.nodes],
+                         [0x13, 0x20, 0x31])
+
+    def test_dropped_client(self):
+        a, b = self.client('a'), self.client('b')
+        self.send(a, ['VIR_Write', 1, 1])
+        self.send(b, ['VIR_Write', 2, 1], ['VDR_Write', 0x22, 7])
+        self.send(a, ['VDR_Write', 0x11, 7])
+
+        # a's running request gets no reply, and its waiting one is dropped
+        a.connection_lost(None)
+        self.expected -= 2
+        self.wait()
+
+        self.assertEqual([name for name, reply in self.replies], ['b'])
+        self.assertEqual([node.leds for node in self.blaster.tap.hub.nodes],
+                         [0, 0x22, 0])
+
+    #----
+
+    def test_clients_over_socket(self):
+        from open_sld.sld_server import SLDClient
+        self.server.start()
+        thread = threading.Thread(target=self.loop.run_forever)
+        thread.start()
+        try:
+            a = SLDClient('SIM', self.server.path)
+            b = SLDClient('SIM', self.server.path)
+            a.VIR_Write(1, 1)
+            b.VIR_Write(2, 1)
+            a.VDR_Write(0x15, 7)
+            b.VDR_Write(0x2A, 7)
+            self.assertEqual(a.VDR_Write_Read(0, 7).uint, 0x15)
+            self.assertEqual(b.VDR_Write_Read(0, 7).uint, 0x2A)
+
+            with a.session() as s:
+                first  = s.VDR_Write_Read(0x33, 7)
+                second = s.VDR_Read(7)
+            self.assertEqual((first.result().uint, second.result().uint),
+                             (0, 0x33))
+            a.close()
+            b.close()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            thread.join()
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()
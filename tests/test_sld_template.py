@@ -0,0 +1,133 @@
+#------------------------------------------------------------------------------
+#
+#   test_sld_template.py
+#
+#   Scan templates against the same operations on the controller
+#
+#------------------------------------------------------------------------------
+
+import unittest
+
+from open_sld.sld_interface import SLD_Controller
+from open_sld.sld_sim import SimulatedBlaster, LEDNode
+
+IDCODE = 0x006
+
+#------------------------------------------------------------------------------
+#
+# Keeps every byte written
+
+class LoggingBlaster(SimulatedBlaster):
+
+    def __init__(self, *args, **kwargs):
+        SimulatedBlaster.__init__(self, *args, **kwargs)
+        self.log = bytearray()
+
+    def write_from(self, data, offset=0, size=None):
+        if size is None:
+            size = len(data) - offset
+        self.log += buffer(data, offset, size)
+        return SimulatedBlaster.write_from(self, data, offset, size)
+
+#------------------------------------------------------------------------------
+
+class TemplateTest(unittest.TestCase):
+
+    def controller(self, **kwargs):
+        blaster = LoggingBlaster([LEDNode(), LEDNode()])
+        return SLD_Controller('SIM', 4, 2, device=blaster, profile=None,
+                              **kwargs)
+
+    #----
+    #
+    # The template's operations, on the controller
+
+    def direct(self, sld, a, b):
+        sld.VIR_Write(1, 1)
+        sld.VDR_Write(a, 7)
+        first = sld.VDR_Write_Read(b, 7)
+        sld.VIR_Write(2, 1)
+        second = sld.VDR_Read(7)
+        sld.IR_Write(IDCODE)
+        third = sld.DR_Write_Read(0, 32)
+        return [first.uint, second.uint, third.uint]
+
+    def template(self, sld):
+        t = sld.template()
+        t.VIR_Write(1, 1)
+        t.VDR_Write(t.field(7))
+        t.VDR_Write_Read(t.field(7))
+        t.VIR_Write(2, 1)
+        t.VDR_Read(7)
+        t.IR_Write(IDCODE)
+        t.DR_Write_Read(0, 32)
+        return t
+
+    #----
+
+    def assertSame(self, direct, templated):
+        self.assertEqual(templated.interface.log, direct.interface.log)
+        self.assertEqual((templated.ir, templated.vir, templated.vir_node),
+                         (direct.ir, direct.vir, direct.vir_node))
+
+    #----
+
+    def test_matches_operations(self):
+        for cache_ir in (True, False):
+            direct = self.controller(cache_ir=cache_ir)
+            templated = self.controller(cache_ir=cache_ir)
+            t = self.template(templated)
+
+            # The shift mode changes between runs on the same controllers
+            for byte_mode in (True, False, True):
+                direct.byte_mode = templated.byte_mode = byte_mode
+                for a, b in [(0x11, 0x22), (0x33, 0x22), (0x7F, 0x00)]:
+                    self.assertEqual([r.uint for r in t.run(a, b)],
+                                     self.direct(direct, a, b))
+                    self.assertSame(direct, templated)
+
+                # Another IR cache state to start from
+                direct.VIR_Write(1, 1)
+                templated.VIR_Write(1, 1)
+
+            # Without IR caching, one compile per shift mode. With it, the
+            # first run, the template's own end state and the VIR_Write
+            # in byte mode, and the last two in bit mode.
+            self.assertEqual(len(t.compiled), 5 if cache_ir else 2)
+
+    def test_key_follows_widths(self):
+        sld = self.controller()
+        t = self.template(sld)
+        key = t.cache_key()
+        sld.node_adrs_width = 3
+        self.assertNotEqual(t.cache_key(), key)
+        sld.node_adrs_width = 2
+        sld.virtual_inst_width = 5
+        self.assertNotEqual(t.cache_key(), key)
+
+    #----
+
+    def test_stats_match_operations(self):
+        direct = self.controller(stats=True)
+        templated = self.controller(stats=True)
+        t = self.template(templated)
+
+        for a, b in [(0x11, 0x22), (0x33, 0x44)]:
+            t.run(a, b)
+            self.direct(direct, a, b)
+
+        counts = lambda stats: dict((key, (s.count, s.bits, s.errors))
+                                    for key, s in stats.ops.items())
+        self.assertEqual(counts(templated.stats), counts(direct.stats))
+        self.assertEqual(templated.stats.ops['VDR_Write_Read', 1].count, 2)
+        self.assertEqual(templated.stats.bytes_written,
+                         direct.stats.bytes_written)
+        self.assertEqual(templated.stats.bytes_read, direct.stats.bytes_read)
+
+        # Reads are timed like the controller's
+        self.assertEqual(templated.stats.read_wait.count, 2)
+
+#------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    unittest.main()